@@ -0,0 +1,115 @@
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from api.cache import (get_key_version, is_cache_shared,
+                       schedule_key_version_bump,)
+from api.routers import read_from_primary
+
+TOKEN_KEY = 'auth_token:{}'
+TOKEN_VERSION_KEY = 'auth_token:version:{}'
+
+
+def get_tokens_version(user_id):
+    return get_key_version(TOKEN_VERSION_KEY.format(user_id))
+
+
+def invalidate_tokens(user_id):
+    """
+    Invalidates the cached tokens of the user once the current transaction
+    is committed, in every process.
+    """
+    schedule_key_version_bump(TOKEN_VERSION_KEY.format(user_id))
+
+
+class TokenLRU:
+    """
+    Bounded in-process cache of the resolved tokens with the tokens version
+    of their user. Tokens are kept pickled, so every request gets its own
+    user instance.
+    """
+    def __init__(self, size):
+        self._lock = threading.Lock()
+        self._tokens = OrderedDict()
+        self._size = size
+
+    def get(self, key):
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is None:
+                return None
+            data, expires = entry
+            if expires < time.monotonic():
+                del self._tokens[key]
+                return None
+            self._tokens.move_to_end(key)
+        return pickle.loads(data)
+
+    def set(self, key, value, timeout):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._tokens[key] = (data, time.monotonic() + timeout)
+            self._tokens.move_to_end(key)
+            while len(self._tokens) > self._size:
+                self._tokens.popitem(last=False)
+
+
+token_lru = TokenLRU(settings.AUTH_TOKEN_CACHE_SIZE)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication which resolves the token to its user from the
+    in-process LRU or from the shared cache, so warm requests do not query
+    the database. Entries hold the tokens version of their user, which is
+    bumped when one of the user's tokens is deleted (logout) or the user is
+    changed (password, deactivation), and are checked against it on every
+    request, so a change drops the tokens of that user only. Entries expire
+    after AUTH_TOKEN_CACHE_TIMEOUT. Without a shared cache a bumped version
+    would not reach the other processes, so tokens are then looked up in
+    the database on every request.
+    """
+    def authenticate_credentials(self, key):
+        if not is_cache_shared():
+            return super().authenticate_credentials(key)
+        timeout = settings.AUTH_TOKEN_CACHE_TIMEOUT
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        cache_key = TOKEN_KEY.format(digest)
+        entry = token_lru.get(digest)
+        if entry is None or not self.is_current(entry):
+            entry = cache.get(cache_key)
+            if entry is None or not self.is_current(entry):
+                entry = self.load_token(key, cache_key, timeout)
+            token_lru.set(digest, entry, timeout)
+        token = entry[1]
+        if not token.user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+        return token.user, token
+
+    @staticmethod
+    def is_current(entry):
+        version, token = entry
+        return version == get_tokens_version(token.user_id)
+
+    def load_token(self, key, cache_key, timeout):
+        """
+        Loads the token from the primary and caches it with the version of
+        its user read before the load, so a change committed meanwhile
+        makes the entry stale rather than lost.
+        """
+        with read_from_primary():
+            user_id = self.get_model().objects.filter(key=key).values_list(
+                'user_id', flat=True).first()
+            version = (get_tokens_version(user_id)
+                       if user_id is not None else None)
+            _, token = super().authenticate_credentials(key)
+        entry = (version, token)
+        cache.set(cache_key, entry, timeout)
+        return entry
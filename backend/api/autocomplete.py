@@ -0,0 +1,87 @@
+import threading
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from api.cache import get_version
+from api.routers import read_from_primary
+from recipes.models import Ingredients
+
+SEPARATOR = '\n'
+
+IndexState = namedtuple(
+    'IndexState', ('version', 'names', 'ids', 'offsets', 'haystack'))
+
+
+class IngredientsIndex:
+    """
+    In-process autocomplete index of the ingredients catalog. Lower-cased
+    names are kept in a sorted array, so exact and prefix matches are found
+    with binary searches, and substring matches are found by searching a
+    single joined string instead of every name one by one. The index is
+    rebuilt lazily when the ingredients version changes. The whole index
+    is one immutable state swapped in a single assignment, so concurrent
+    searches never see names and ids from different builds.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = IndexState(None, (), (), (), '')
+
+    def _build(self, version):
+        with read_from_primary():
+            rows = sorted((name.lower(), pk) for pk, name in
+                          Ingredients.objects.values_list('pk', 'name'))
+        names = [name for name, _ in rows]
+        offsets = []
+        position = 0
+        for name in names:
+            offsets.append(position)
+            position += len(name) + len(SEPARATOR)
+        return IndexState(
+            version, tuple(names), tuple(pk for _, pk in rows),
+            tuple(offsets), SEPARATOR.join(names))
+
+    def _ensure_built(self):
+        version = get_version(Ingredients)
+        state = self._state
+        if state.version != version:
+            with self._lock:
+                state = self._state
+                if state.version != version:
+                    state = self._build(version)
+                    self._state = state
+        return state
+
+    def search(self, value, limit=None):
+        """
+        Returns ids of the ingredients whose names contain the value,
+        ranked as exact matches first, then prefix and then substring
+        matches, each group in alphabetical order.
+        """
+        state = self._ensure_built()
+        value = value.strip().lower()
+        if not value or SEPARATOR in value:
+            return []
+        names, ids = state.names, state.ids
+        start = bisect_left(names, value)
+        exact_end = bisect_right(names, value, start)
+        prefix_end = bisect_left(names, value + '\uffff', exact_end)
+        result = list(ids[start:prefix_end])
+        if limit is not None and len(result) >= limit:
+            return result[:limit]
+
+        found = set()
+        position = state.haystack.find(value)
+        while position != -1:
+            index = bisect_right(state.offsets, position) - 1
+            if index < start or index >= prefix_end:
+                found.add(index)
+            position = state.haystack.find(
+                value, state.offsets[index] + len(names[index]))
+        for index in sorted(found):
+            result.append(ids[index])
+            if limit is not None and len(result) >= limit:
+                break
+        return result
+
+
+ingredients_index = IngredientsIndex()
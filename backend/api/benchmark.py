@@ -0,0 +1,418 @@
+import base64
+import io
+import json
+import random
+import re
+import statistics
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, resolve
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (FavoriteRecipe, Follow, IngredientInRecipe,
+                            Ingredients, RecipeInCart, Recipes, Tags,)
+
+User = get_user_model()
+
+DEFAULT_SIZES = {
+    'users': 50,
+    'recipes': 500,
+    'tags': 10,
+    'ingredients': 2000,
+    'ingredients_per_recipe': 8,
+    'follows': 20,
+    'favorites': 100,
+    'carts': 20,
+}
+BATCH_SIZE = 1000
+PASSWORD = 'benchmark-password'
+BUDGET_METRICS = ('queries', 'p50_ms', 'p95_ms', 'memory_kb')
+API_URLCONF = 'api.urls'
+API_PREFIX = '/api'
+PLACEHOLDER_RE = re.compile(r'{\w+}')
+
+
+def get_png():
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), '#FF0000').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def get_image():
+    return 'data:image/png;base64,{}'.format(
+        base64.b64encode(get_png()).decode())
+
+
+def seed(sizes, seed_value=0):
+    """
+    Creates the synthetic dataset and returns the context used to build
+    the urls: the user who makes the requests and ids of the objects.
+    Favorites, carts and follows of the first user get the requested sizes
+    (the first recipe and the second user are left free for the toggling
+    endpoints), the other users get random ones.
+    """
+    rnd = random.Random(seed_value)
+    password = make_password(PASSWORD)
+    User.objects.bulk_create(
+        (User(username='bench{}'.format(i),
+              email='bench{}@foodgram.io'.format(i), password=password)
+         for i in range(sizes['users'])),
+        batch_size=BATCH_SIZE)
+    users = list(User.objects.filter(username__startswith='bench').order_by(
+        'pk').values_list('pk', flat=True))
+    Tags.objects.bulk_create(
+        (Tags(name='bench tag {}'.format(i), slug='bench-tag-{}'.format(i))
+         for i in range(sizes['tags'])), batch_size=BATCH_SIZE)
+    tags = list(Tags.objects.filter(slug__startswith='bench-tag-').values_list(
+        'pk', flat=True))
+    Ingredients.objects.bulk_create(
+        (Ingredients(name='bench ingredient {}'.format(i),
+                     measurement_unit='g')
+         for i in range(sizes['ingredients'])),
+        batch_size=BATCH_SIZE, ignore_conflicts=True)
+    ingredients = list(Ingredients.objects.filter(
+        name__startswith='bench ingredient ').values_list('pk', flat=True))
+    Recipes.objects.bulk_create(
+        (Recipes(name='bench recipe {}'.format(i), author_id=rnd.choice(users),
+                 text='Benchmark recipe description. ' * 10,
+                 image='recipes/images/bench/recipe.png',
+                 cooking_time=rnd.randint(1, 120))
+         for i in range(sizes['recipes'])), batch_size=BATCH_SIZE)
+    recipes = list(Recipes.objects.filter(
+        name__startswith='bench recipe ').values_list('pk', flat=True))
+
+    Recipes.tags.through.objects.bulk_create(
+        (Recipes.tags.through(recipes_id=recipe, tags_id=tag)
+         for recipe in recipes
+         for tag in rnd.sample(tags, min(2, len(tags)))),
+        batch_size=BATCH_SIZE)
+    IngredientInRecipe.objects.bulk_create(
+        (IngredientInRecipe(recipe_id=recipe, ingredient_id=ingredient,
+                            amount=rnd.randint(1, 500))
+         for recipe in recipes
+         for ingredient in rnd.sample(
+             ingredients, min(sizes['ingredients_per_recipe'],
+                              len(ingredients)))),
+        batch_size=BATCH_SIZE)
+
+    def sample(population, size):
+        return rnd.sample(population, min(size, len(population)))
+
+    user, others = users[0], users[1:]
+    Follow.objects.bulk_create(
+        (Follow(follower_id=follower, author_id=author)
+         for follower in users
+         for author in (sample(others[1:], sizes['follows'])
+                        if follower == user
+                        else sample(users, rnd.randint(0, sizes['follows'])))
+         if author != follower), batch_size=BATCH_SIZE)
+    for model, size in ((FavoriteRecipe, sizes['favorites']),
+                        (RecipeInCart, sizes['carts'])):
+        model.objects.bulk_create(
+            (model(user_id=owner, recipe_id=recipe)
+             for owner in users
+             for recipe in (sample(recipes[1:], size) if owner == user
+                            else sample(recipes, rnd.randint(0, size)))),
+            batch_size=BATCH_SIZE)
+    call_command('recount', stdout=io.StringIO())
+    call_command('rebuild_search_index', stdout=io.StringIO())
+    call_command('build_recommendations', stdout=io.StringIO())
+    call_command('verify_shopping_lists', all=True, stdout=io.StringIO())
+
+    return {
+        'user': User.objects.get(pk=user),
+        'recipe': recipes[-1],
+        'free_recipe': recipes[0],
+        'author': others[0],
+        'follow': Follow.objects.filter(follower_id=user).order_by(
+            'pk').values_list('pk', flat=True).first(),
+        'tag': tags[0],
+        'tag_slug': 'bench-tag-0',
+        'ingredient': ingredients[0],
+        'pantry': ','.join(str(pk) for pk in ingredients[:20]),
+        'ingredients': ingredients,
+        'tags': tags,
+    }
+
+
+def recipe_payload(context):
+    return {
+        'tags': context['tags'][:2],
+        'ingredients': [{'id': pk, 'amount': 10}
+                        for pk in context['ingredients'][:8]],
+        'name': 'benchmark recipe',
+        'text': 'Created by the benchmark.',
+        'cooking_time': 10,
+        'image': context['image'],
+    }
+
+
+def image_upload(context):
+    return {'image': SimpleUploadedFile('recipe.png', get_png(),
+                                        content_type='image/png')}
+
+
+def user_payload(context):
+    """A new user for every request, the e-mail and username are unique."""
+    context['new_users'] = context.get('new_users', 0) + 1
+    return {
+        'email': 'bench-new{}@foodgram.io'.format(context['new_users']),
+        'username': 'bench-new{}'.format(context['new_users']),
+        'first_name': 'Benchmark',
+        'last_name': 'User',
+        'password': PASSWORD,
+    }
+
+
+def profile_payload(context):
+    user = context['user']
+    return {'email': user.email, 'username': user.username,
+            'first_name': user.first_name, 'last_name': user.last_name}
+
+
+# (name, method, url, data, anonymous). Urls are formatted with the
+# context; the sequence restores the initial state of the dataset, except
+# for the created users. Every route of api.urls is requested, apart from
+# NOT_BENCHMARKED.
+ENDPOINTS = (
+    ('api-root', 'get', '/api/', None, False),
+    ('tags-list', 'get', '/api/tags/', None, True),
+    ('tags-detail', 'get', '/api/tags/{tag}/', None, True),
+    ('ingredients-list', 'get', '/api/ingredients/', None, True),
+    ('ingredients-search', 'get', '/api/ingredients/?name=ingredient 1',
+     None, True),
+    ('ingredients-detail', 'get', '/api/ingredients/{ingredient}/', None,
+     True),
+    ('recipes-list-anonymous', 'get', '/api/recipes/?limit=6', None, True),
+    ('recipes-list', 'get', '/api/recipes/?limit=6', None, False),
+    ('recipes-list-deep-page', 'get', '/api/recipes/?limit=6&page=50', None,
+     False),
+    ('recipes-list-cursor', 'get', '/api/recipes/?limit=6&cursor=', None,
+     False),
+    ('recipes-list-favorited', 'get',
+     '/api/recipes/?limit=6&is_favorited=1', None, False),
+    ('recipes-list-tags', 'get', '/api/recipes/?limit=6&tags={tag_slug}',
+     None, False),
+    ('recipes-search', 'get', '/api/recipes/?limit=6&search=bench recipe 1',
+     None, False),
+    ('recipes-match', 'get',
+     '/api/recipes/match/?limit=6&ingredients={pantry}&max_missing=6', None,
+     False),
+    ('recipes-similar', 'get', '/api/recipes/{recipe}/similar/', None,
+     False),
+    ('recipes-recommended', 'get', '/api/recipes/recommended/?limit=6', None,
+     False),
+    ('recipes-detail', 'get', '/api/recipes/{recipe}/', None, False),
+    ('recipes-create', 'post', '/api/recipes/', recipe_payload, False),
+    ('recipes-update', 'patch', '/api/recipes/{new_recipe}/', recipe_payload,
+     False),
+    ('recipes-replace', 'put', '/api/recipes/{new_recipe}/', recipe_payload,
+     False),
+    ('recipes-image', 'put', '/api/recipes/{new_recipe}/image/',
+     image_upload, False),
+    ('recipes-delete', 'delete', '/api/recipes/{new_recipe}/', None, False),
+    ('favorite-add', 'post', '/api/recipes/{free_recipe}/favorite/', None,
+     False),
+    ('favorite-remove', 'delete', '/api/recipes/{free_recipe}/favorite/',
+     None, False),
+    ('shopping-cart-add', 'post', '/api/recipes/{free_recipe}/shopping_cart/',
+     None, False),
+    ('shopping-cart-remove', 'delete',
+     '/api/recipes/{free_recipe}/shopping_cart/', None, False),
+    ('shopping-cart-download', 'get', '/api/recipes/download_shopping_cart/',
+     None, False),
+    ('shopping-cart-summary', 'get', '/api/recipes/shopping_cart_summary/',
+     None, False),
+    ('subscriptions-list', 'get',
+     '/api/users/subscriptions/?limit=6&recipes_limit=3', None, False),
+    ('subscriptions-detail', 'get',
+     '/api/users/subscriptions/{follow}/?recipes_limit=3', None, False),
+    ('subscribe', 'post', '/api/users/{author}/subscribe/', None, False),
+    ('unsubscribe', 'delete', '/api/users/{author}/subscribe/', None, False),
+    ('users-list', 'get', '/api/users/?limit=6', None, False),
+    ('users-create', 'post', '/api/users/', user_payload, True),
+    ('users-me', 'get', '/api/users/me/', None, False),
+    ('users-me-replace', 'put', '/api/users/me/', profile_payload, False),
+    ('users-me-update', 'patch', '/api/users/me/', {'last_name': ''}, False),
+    ('users-detail', 'get', '/api/users/{author}/', None, False),
+    ('users-detail-replace', 'put', '/api/users/{user_id}/',
+     profile_payload, False),
+    ('users-detail-update', 'patch', '/api/users/{user_id}/',
+     {'first_name': ''}, False),
+    ('users-set-password', 'post', '/api/users/set_password/',
+     {'current_password': PASSWORD, 'new_password': PASSWORD}, False),
+    ('token-login', 'post', '/api/auth/token/login/', None, True),
+    ('token-logout', 'post', '/api/auth/token/logout/', None, False),
+)
+
+# (route, method) of api.urls which are not requested, with the reasons.
+NOT_BENCHMARKED = {
+    # The e-mail flows of djoser need the uid and token sent by e-mail.
+    ('user-activation', 'post'),
+    ('user-resend-activation', 'post'),
+    ('user-reset-password', 'post'),
+    ('user-reset-password-confirm', 'post'),
+    ('user-reset-username', 'post'),
+    ('user-reset-username-confirm', 'post'),
+    # The login e-mail is the username field, so it would change the login.
+    ('user-set-username', 'post'),
+    # Would delete the user who makes the requests.
+    ('user-me', 'delete'),
+    ('user-detail', 'delete'),
+    # Subscriptions are written through users/<id>/subscribe/.
+    ('subs-list', 'post'),
+    ('subs-detail', 'put'),
+    ('subs-detail', 'patch'),
+    ('subs-detail', 'delete'),
+}
+
+
+def get_view_methods(callback):
+    actions = getattr(callback, 'actions', None)
+    if actions is not None:
+        return list(actions)
+    view_class = callback.view_class
+    return [method for method in view_class.http_method_names
+            if method not in ('head', 'options') and hasattr(view_class,
+                                                             method)]
+
+
+def get_routes(patterns=None, prefix=''):
+    """
+    Returns (route, method) of every view of api.urls, the route being the
+    url name or, for unnamed urls, the pattern. The format suffix variants
+    of the urls are skipped.
+    """
+    if patterns is None:
+        patterns = get_resolver(API_URLCONF).url_patterns
+    routes = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            routes |= get_routes(pattern.url_patterns,
+                                 prefix + str(pattern.pattern))
+        elif 'format' not in pattern.pattern.regex.groupindex:
+            route = pattern.name or prefix + str(pattern.pattern)
+            routes.update((route, method)
+                          for method in get_view_methods(pattern.callback))
+    return routes
+
+
+def get_unbenchmarked_routes():
+    """Returns the routes of api.urls which ENDPOINTS do not request."""
+    covered = set()
+    for _, method, url, *_ in ENDPOINTS:
+        path = PLACEHOLDER_RE.sub('1', url.split('?')[0])
+        match = resolve(path[len(API_PREFIX):], urlconf=API_URLCONF)
+        covered.add((match.url_name or match.route, method))
+    return sorted(get_routes() - covered - NOT_BENCHMARKED)
+
+
+class Benchmark:
+    """
+    Requests every endpoint of ENDPOINTS through the DRF test client and
+    collects latency percentiles, number of queries and allocated memory
+    (measured in a separate pass, so tracing does not skew the latency).
+    """
+    def __init__(self, context, iterations=20):
+        self.context = dict(context, image=get_image(),
+                            user_id=context['user'].pk)
+        self.iterations = iterations
+        self.client = APIClient()
+        self.anonymous_client = APIClient()
+        self.authenticate()
+        self.samples = {name: [] for name, *_ in ENDPOINTS}
+        self.queries = {}
+        self.memory = {}
+        self.statuses = {}
+
+    def authenticate(self):
+        token, _ = Token.objects.get_or_create(user=self.context['user'])
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+    def request(self, endpoint):
+        name, method, url, data, anonymous = endpoint
+        if name == 'token-login':
+            data = {'email': self.context['user'].email,
+                    'password': PASSWORD}
+        elif callable(data):
+            data = data(self.context)
+        client = self.anonymous_client if anonymous else self.client
+        response = getattr(client, method)(
+            url.format(**self.context), data=data,
+            format='multipart' if name == 'recipes-image' else 'json')
+        if name == 'recipes-create' and response.status_code == 201:
+            self.context['new_recipe'] = response.data['id']
+        elif name == 'token-logout':
+            self.authenticate()
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)
+        return response
+
+    def run_once(self, measure_memory=False):
+        for endpoint in ENDPOINTS:
+            name = endpoint[0]
+            if measure_memory:
+                tracemalloc.start()
+                self.request(endpoint)
+                self.memory[name] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                continue
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = self.request(endpoint)
+                self.samples[name].append(time.perf_counter() - started)
+            self.queries[name] = len(queries.captured_queries)
+            self.statuses[name] = response.status_code
+
+    def run(self):
+        self.run_once()
+        self.samples = {name: [] for name in self.samples}
+        for _ in range(self.iterations):
+            self.run_once()
+        self.run_once(measure_memory=True)
+        return self.report()
+
+    def report(self):
+        results = {}
+        for name, samples in self.samples.items():
+            samples = sorted(sample * 1000 for sample in samples)
+            percentiles = (statistics.quantiles(samples, n=20)
+                           if len(samples) > 1 else samples * 19)
+            results[name] = {
+                'status': self.statuses[name],
+                'queries': self.queries[name],
+                'p50_ms': round(statistics.median(samples), 3),
+                'p95_ms': round(percentiles[18], 3),
+                'memory_kb': round(self.memory[name] / 1024, 1),
+            }
+        return results
+
+
+def check_budget(results, budget):
+    """
+    Returns the list of violations of the budget, a mapping of endpoint
+    names to the maximum values of BUDGET_METRICS ('*' applies to every
+    endpoint).
+    """
+    violations = []
+    for name, result in results.items():
+        limits = dict(budget.get('*', {}), **budget.get(name, {}))
+        for metric in BUDGET_METRICS:
+            if metric in limits and result[metric] > limits[metric]:
+                violations.append('{}: {} is {}, budget is {}'.format(
+                    name, metric, result[metric], limits[metric]))
+    return violations
+
+
+def load_budget(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
@@ -0,0 +1,142 @@
+import hashlib
+import threading
+import time
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from api.routers import read_from_primary
+
+RESPONSE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def is_cache_shared():
+    """
+    Returns whether the default cache is shared between processes. A local
+    memory cache is private to its process, so versions bumped there are
+    not seen by the other gunicorn workers or by management commands.
+    """
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS],
+                          (LocMemCache, DummyCache))
+
+
+def get_version_key(model):
+    return 'version:{}'.format(model._meta.label_lower)
+
+
+def get_initial_version():
+    """
+    Returns the version to start from when the version key is missing.
+    Versions are seeded from the current time rather than from 1, so a
+    version key evicted from the cache never restarts at a value whose
+    entries may still be cached.
+    """
+    return time.time_ns()
+
+
+def get_key_version(key):
+    """
+    Returns the current version stored under the key. The version is
+    stored in the shared cache, so all worker processes see the same value.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, get_initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_key_version(key):
+    """Increments the version stored under the key and returns it."""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = get_initial_version()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def get_version(model):
+    """Returns the current data version of the model."""
+    return get_key_version(get_version_key(model))
+
+
+def bump_version(model):
+    """
+    Invalidates everything cached for the previous model version and
+    returns the new version.
+    """
+    return bump_key_version(get_version_key(model))
+
+
+_local = threading.local()
+
+
+def _bump_pending():
+    keys = _local.__dict__.pop('pending', None)
+    for key in keys or ():
+        bump_key_version(key)
+
+
+def schedule_key_version_bump(key):
+    """
+    Bumps the version stored under the key once the current transaction is
+    committed, once for all the rows changed in the transaction. Bumped
+    earlier, a reader could cache the uncommitted state under the new
+    version.
+    """
+    _local.__dict__.setdefault('pending', set()).add(key)
+    transaction.on_commit(_bump_pending)
+
+
+def schedule_version_bump(model):
+    schedule_key_version_bump(get_version_key(model))
+
+
+class CachedResponseMixin:
+    """
+    Caches the rendered json of the list and retrieve responses of a
+    read-only viewset. The key includes the model version, which is bumped
+    when the model changes, so stale responses are never served. Clients
+    get an ETag and can revalidate without the response being rebuilt.
+    """
+    cache_timeout = RESPONSE_CACHE_TIMEOUT
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(super().list, request, *args,
+                                        **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(super().retrieve, request, *args,
+                                        **kwargs)
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if renderer.format != 'json':
+            return handler(request, *args, **kwargs)
+        model = self.get_queryset().model
+        key = 'response:{}:{}:{}'.format(
+            model._meta.label_lower, get_version(model),
+            hashlib.md5(request.get_full_path().encode()).hexdigest())
+        etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return response
+        content = cache.get(key)
+        if content is None:
+            with read_from_primary():
+                response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            content = renderer.render(response.data,
+                                      request.accepted_media_type,
+                                      self.get_renderer_context())
+            cache.set(key, content, self.cache_timeout)
+        response = HttpResponse(content, content_type=renderer.media_type)
+        response['ETag'] = etag
+        return response
@@ -1,7 +1,11 @@
+from django.conf import settings
 from django.db import models
 from django_filters import AllValuesMultipleFilter, rest_framework as filters
+from rest_framework.filters import OrderingFilter
 
+from api.autocomplete import ingredients_index
 from recipes.models import Ingredients, Recipes
+from recipes.search import search_recipes
 
 
 class RecipesFilter(filters.FilterSet):
@@ -9,10 +13,12 @@ class RecipesFilter(filters.FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
     tags = AllValuesMultipleFilter(field_name='tags__slug')
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipes
-        fields = ('author', 'is_favorited', 'is_in_shopping_cart', 'tags',)
+        fields = ('author', 'is_favorited', 'is_in_shopping_cart', 'tags',
+                  'search',)
 
     def filter_is_favorited(self, queryset, name, value):
         if value:
@@ -24,6 +30,21 @@ class RecipesFilter(filters.FilterSet):
             return queryset.filter(recipe_in_cart__user=self.request.user)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+
+class RecipesOrderingFilter(OrderingFilter):
+    """
+    Orders the found recipes by relevance, unless another ordering is
+    requested.
+    """
+    def filter_queryset(self, request, queryset, view):
+        if (self.ordering_param not in request.query_params
+                and 'search_rank' in queryset.query.annotations):
+            return queryset.order_by('-search_rank', *view.ordering)
+        return super().filter_queryset(request, queryset, view)
+
 
 class IngredientsFilter(filters.FilterSet):
     name = filters.CharFilter(method='filter_name')
@@ -33,8 +54,13 @@ class IngredientsFilter(filters.FilterSet):
         fields = ('name',)
 
     def filter_name(self, queryset, name, value):
-        q_exact = queryset.filter(name__iexact=value).annotate(
-            q_ord=models.Value(0, models.IntegerField()))
-        q_contains = queryset.filter(name__icontains=value).annotate(
-            q_ord=models.Value(1, models.IntegerField()))
-        return q_exact.union(q_contains).order_by('q_ord')
+        ids = ingredients_index.search(
+            value, settings.INGREDIENTS_AUTOCOMPLETE_LIMIT)
+        if not ids:
+            return queryset.none()
+        ranking = models.Case(
+            *[models.When(pk=pk, then=models.Value(position))
+              for position, pk in enumerate(ids)],
+            output_field=models.IntegerField(),
+        )
+        return queryset.filter(pk__in=ids).order_by(ranking)
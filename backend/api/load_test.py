@@ -0,0 +1,100 @@
+import json
+import statistics
+import threading
+import time
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+# The read endpoints which are requested in turn; {recipe} is the id of the
+# first recipe of the list.
+LOAD_TEST_PATHS = (
+    '/api/recipes/?limit=6',
+    '/api/recipes/{recipe}/',
+    '/api/tags/',
+    '/api/ingredients/?name=a',
+)
+REQUEST_TIMEOUT = 30
+
+
+def fetch(url, headers):
+    """Returns the status and the body of a GET request."""
+    try:
+        with urlopen(Request(url, headers=headers),
+                     timeout=REQUEST_TIMEOUT) as response:
+            return response.status, response.read()
+    except HTTPError as error:
+        return error.code, error.read()
+    except (URLError, OSError):
+        return None, b''
+
+
+class LoadTest:
+    """
+    Requests the read endpoints of a running server from concurrent
+    threads for the given duration and collects the throughput, latency
+    percentiles and errors, so server configurations can be compared on
+    the same resources.
+    """
+    def __init__(self, base_url, concurrency=16, duration=30, token=None,
+                 paths=LOAD_TEST_PATHS):
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.duration = duration
+        self.headers = {'Accept': 'application/json'}
+        if token:
+            self.headers['Authorization'] = 'Token {}'.format(token)
+        self.paths = paths
+        self.samples = []
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def get_urls(self):
+        status, body = fetch(self.base_url + '/api/recipes/?limit=1',
+                             self.headers)
+        if status != 200:
+            raise ValueError('{}/api/recipes/ answered {}.'.format(
+                self.base_url, status))
+        results = json.loads(body)['results']
+        context = {'recipe': results[0]['id'] if results else 0}
+        return [self.base_url + path.format(**context) for path in self.paths
+                if results or '{recipe}' not in path]
+
+    def worker(self, urls, offset, deadline):
+        samples, errors = [], 0
+        index = offset
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            status, _ = fetch(urls[index % len(urls)], self.headers)
+            samples.append(time.perf_counter() - started)
+            if status != 200:
+                errors += 1
+            index += 1
+        with self.lock:
+            self.samples.extend(samples)
+            self.errors += errors
+
+    def run(self):
+        urls = self.get_urls()
+        started = time.perf_counter()
+        deadline = started + self.duration
+        threads = [threading.Thread(target=self.worker,
+                                    args=(urls, offset, deadline))
+                   for offset in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.report(time.perf_counter() - started)
+
+    def report(self, elapsed):
+        samples = sorted(sample * 1000 for sample in self.samples)
+        percentiles = (statistics.quantiles(samples, n=20)
+                       if len(samples) > 1 else samples * 19 or [0] * 19)
+        return {
+            'concurrency': self.concurrency,
+            'requests': len(samples),
+            'errors': self.errors,
+            'requests_per_second': round(len(samples) / elapsed, 1),
+            'p50_ms': round(statistics.median(samples), 3) if samples else 0,
+            'p95_ms': round(percentiles[18], 3),
+        }
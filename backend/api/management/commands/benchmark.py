@@ -0,0 +1,75 @@
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (override_settings, setup_databases,
+                               setup_test_environment, teardown_databases,
+                               teardown_test_environment,)
+
+from api.benchmark import (DEFAULT_SIZES, Benchmark, check_budget,
+                           get_unbenchmarked_routes, load_budget, seed,)
+
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+
+
+class Command(BaseCommand):
+    help = ('Seeds a synthetic dataset in a test database, requests every '
+            'API endpoint and reports p50/p95 latency, number of queries and '
+            'allocated memory per endpoint. With --budget the command fails '
+            'when a measurement exceeds its budget.')
+
+    def add_arguments(self, parser):
+        for name, default in DEFAULT_SIZES.items():
+            parser.add_argument('--{}'.format(name.replace('_', '-')),
+                                type=int, default=default, dest=name)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--output', help='Write the results as json.')
+        parser.add_argument('--budget', help='A json file with the maximum '
+                                             'values per endpoint.')
+
+    def handle(self, *args, **options):
+        missing = get_unbenchmarked_routes()
+        if missing:
+            raise CommandError('Routes without a benchmark: {}'.format(
+                ', '.join('{} {}'.format(method.upper(), route)
+                          for route, method in missing)))
+        sizes = {name: options[name] for name in DEFAULT_SIZES}
+        setup_test_environment()
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(MEDIA_ROOT=media_root,
+                                      CACHES=BENCHMARK_CACHES):
+                old_config = setup_databases(verbosity=0, interactive=False)
+                try:
+                    results = Benchmark(seed(sizes),
+                                        options['iterations']).run()
+                finally:
+                    teardown_databases(old_config, verbosity=0)
+        finally:
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({'sizes': sizes, 'results': results}, file,
+                          indent=2)
+        self.print_results(results)
+        if options['budget']:
+            violations = check_budget(results, load_budget(options['budget']))
+            if violations:
+                raise CommandError('Budget exceeded:\n' + '\n'.join(
+                    violations))
+            self.stdout.write(self.style.SUCCESS('Budget is met.'))
+
+    def print_results(self, results):
+        row = '{:<28} {:>6} {:>8} {:>10} {:>10} {:>11}'
+        self.stdout.write(row.format('endpoint', 'status', 'queries',
+                                     'p50 ms', 'p95 ms', 'memory kb'))
+        for name, result in results.items():
+            self.stdout.write(row.format(
+                name, result['status'], result['queries'], result['p50_ms'],
+                result['p95_ms'], result['memory_kb']))
@@ -0,0 +1,66 @@
+import psycopg2
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+PGBOUNCER_POOL_COLUMNS = ('cl_active', 'cl_waiting', 'sv_active', 'sv_idle',
+                          'sv_used', 'maxwait')
+
+
+class Command(BaseCommand):
+    help = ('Reports the utilization of the database connections: the '
+            'connections of the database by state against max_connections '
+            'and, with --pgbouncer, the client and server connections of '
+            'every pgbouncer pool.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pgbouncer', metavar='HOST:PORT',
+                            help='Address of pgbouncer, e.g. pgbouncer:6432.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Connection statistics need PostgreSQL.')
+        self.database_stats()
+        if options['pgbouncer']:
+            self.pgbouncer_stats(options['pgbouncer'])
+
+    def database_stats(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW max_connections')
+            max_connections = int(cursor.fetchone()[0])
+            cursor.execute(
+                'SELECT coalesce(state, %s), count(*) FROM pg_stat_activity '
+                'WHERE datname = current_database() GROUP BY 1 ORDER BY 1',
+                ['unknown'])
+            states = cursor.fetchall()
+        total = sum(count for _, count in states)
+        self.stdout.write('Database connections: {} of {} ({:.0%}).'.format(
+            total, max_connections, total / max_connections))
+        for state, count in states:
+            self.stdout.write('  {:<30} {:>6}'.format(state, count))
+
+    def pgbouncer_stats(self, address):
+        host, _, port = address.partition(':')
+        settings = connection.settings_dict
+        try:
+            pgbouncer = psycopg2.connect(
+                host=host, port=port or 6432, dbname='pgbouncer',
+                user=settings['USER'], password=settings['PASSWORD'])
+        except psycopg2.Error as error:
+            raise CommandError('Cannot connect to pgbouncer: {}'.format(
+                error))
+        try:
+            pgbouncer.autocommit = True
+            with pgbouncer.cursor() as cursor:
+                cursor.execute('SHOW POOLS')
+                columns = [column.name for column in cursor.description]
+                pools = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        finally:
+            pgbouncer.close()
+        row = '{:<20} {:<16}' + ' {:>10}' * len(PGBOUNCER_POOL_COLUMNS)
+        self.stdout.write('pgbouncer pools:')
+        self.stdout.write(row.format('database', 'user',
+                                     *PGBOUNCER_POOL_COLUMNS))
+        for pool in pools:
+            self.stdout.write(row.format(
+                pool['database'], pool['user'],
+                *(pool.get(column, '') for column in PGBOUNCER_POOL_COLUMNS)))
@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.load_test import LoadTest
+
+
+class Command(BaseCommand):
+    help = ('Requests the recipe, tag and ingredient read endpoints of a '
+            'running server from concurrent clients and reports the '
+            'throughput and p50/p95 latency, e.g. to compare gunicorn worker '
+            'settings on the same resources.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url', help='e.g. http://localhost:8000')
+        parser.add_argument('--concurrency', type=int, nargs='+',
+                            default=[16],
+                            help='One run per number of concurrent clients.')
+        parser.add_argument('--duration', type=float, default=30,
+                            help='Seconds of every run.')
+        parser.add_argument('--token', help='Authenticate the requests.')
+        parser.add_argument('--output', help='Write the results as json.')
+
+    def handle(self, *args, **options):
+        results = []
+        for concurrency in options['concurrency']:
+            try:
+                results.append(LoadTest(
+                    options['base_url'], concurrency, options['duration'],
+                    options['token']).run())
+            except ValueError as error:
+                raise CommandError(error)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2)
+        row = '{:>11} {:>9} {:>7} {:>8} {:>10} {:>10}'
+        self.stdout.write(row.format('concurrency', 'requests', 'errors',
+                                     'req/s', 'p50 ms', 'p95 ms'))
+        for result in results:
+            self.stdout.write(row.format(
+                result['concurrency'], result['requests'], result['errors'],
+                result['requests_per_second'], result['p50_ms'],
+                result['p95_ms']))
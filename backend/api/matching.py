@@ -0,0 +1,144 @@
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+
+from api.cache import bump_version, get_version
+from api.routers import read_from_primary
+from recipes.models import IngredientInRecipe
+
+CHANGES_KEY = 'recipe_matching:changes:{}'
+CHANGES_TIMEOUT = 60 * 60
+MAX_REPLAYED_CHANGES = 500
+CHUNK_SIZE = 5000
+
+
+class RecipeMatchingIndex:
+    """
+    In-process inverted index from ingredients to the recipes which use
+    them, kept as sorted arrays of recipe ids, so matching a set of
+    ingredients reads only their posting lists instead of joining the whole
+    ingredients in recipes table. Writes update the index incrementally and
+    publish the changed recipes in the shared cache under a new version;
+    other processes replay only those recipes and rebuild the whole index
+    when the log of changes has expired.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._postings = {}
+        self._ingredients = {}
+        self._version = None
+
+    def _build(self, version):
+        postings = defaultdict(lambda: array('q'))
+        ingredients = defaultdict(lambda: array('q'))
+        with read_from_primary():
+            rows = IngredientInRecipe.objects.order_by(
+                'ingredient_id', 'recipe_id').values_list(
+                'ingredient_id', 'recipe_id').iterator(chunk_size=CHUNK_SIZE)
+            for ingredient_id, recipe_id in rows:
+                postings[ingredient_id].append(recipe_id)
+                ingredients[recipe_id].append(ingredient_id)
+        self._postings = dict(postings)
+        self._ingredients = dict(ingredients)
+        self._version = version
+
+    def _apply(self, recipe_ids):
+        """Replaces the ingredients of the recipes with the current ones."""
+        current = defaultdict(set)
+        with read_from_primary():
+            rows = list(IngredientInRecipe.objects.filter(
+                recipe_id__in=recipe_ids).values_list('recipe_id',
+                                                      'ingredient_id'))
+        for recipe_id, ingredient_id in rows:
+            current[recipe_id].add(ingredient_id)
+        for recipe_id in recipe_ids:
+            old = set(self._ingredients.pop(recipe_id, ()))
+            new = current[recipe_id]
+            for ingredient_id in old - new:
+                posting = self._postings[ingredient_id]
+                del posting[bisect_left(posting, recipe_id)]
+                if not posting:
+                    del self._postings[ingredient_id]
+            for ingredient_id in new - old:
+                insort(self._postings.setdefault(ingredient_id, array('q')),
+                       recipe_id)
+            if new:
+                self._ingredients[recipe_id] = array('q', sorted(new))
+
+    def _sync(self):
+        version = get_version(IngredientInRecipe)
+        if self._version == version:
+            return
+        with self._lock:
+            if self._version == version:
+                return
+            if (self._version is None or version < self._version
+                    or version - self._version > MAX_REPLAYED_CHANGES):
+                self._build(version)
+                return
+            keys = [CHANGES_KEY.format(number)
+                    for number in range(self._version + 1, version + 1)]
+            changes = cache.get_many(keys)
+            if len(changes) != len(keys):
+                self._build(version)
+                return
+            self._apply({recipe_id for recipe_ids in changes.values()
+                         for recipe_id in recipe_ids})
+            self._version = version
+
+    def _publish(self, recipe_ids):
+        with self._lock:
+            self._sync()
+            self._apply(recipe_ids)
+            version = bump_version(IngredientInRecipe)
+            cache.set(CHANGES_KEY.format(version), recipe_ids,
+                      CHANGES_TIMEOUT)
+            if self._version == version - 1:
+                self._version = version
+
+    def _publish_pending(self):
+        recipe_ids = self._local.__dict__.pop('pending', None)
+        if recipe_ids:
+            self._publish(list(recipe_ids))
+
+    def update(self, recipe_ids):
+        """
+        Reindexes the ingredients of the recipes (deleted recipes are
+        dropped) once the current transaction is committed. The recipes
+        changed in one transaction are published together.
+        """
+        self._local.__dict__.setdefault('pending', set()).update(recipe_ids)
+        transaction.on_commit(self._publish_pending)
+
+    def invalidate(self):
+        """Makes every process rebuild the whole index."""
+        bump_version(IngredientInRecipe)
+
+    def match(self, ingredient_ids, max_missing=None):
+        """
+        Returns (recipe id, matched, missing) of the recipes which use any
+        of the ingredients and miss at most max_missing of their own,
+        ranked by the share of their ingredients the set covers, then by
+        the number of matched ingredients and newer recipes first.
+        """
+        self._sync()
+        with self._lock:
+            matched = Counter()
+            for ingredient_id in set(ingredient_ids):
+                matched.update(self._postings.get(ingredient_id, ()))
+            result = []
+            for recipe_id, count in matched.items():
+                missing = len(self._ingredients[recipe_id]) - count
+                if max_missing is None or missing <= max_missing:
+                    result.append((recipe_id, count, missing))
+        result.sort(key=lambda item: (-item[1] / (item[1] + item[2]),
+                                      -item[1], -item[0]))
+        return result
+
+
+recipe_matching_index = RecipeMatchingIndex()
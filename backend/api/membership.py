@@ -0,0 +1,130 @@
+import threading
+from array import array
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import IntegerField, Value
+
+from api.cache import bump_key_version, get_key_version, is_cache_shared
+from api.routers import read_from_primary
+from recipes.models import FavoriteRecipe, Follow, RecipeInCart
+
+FAVORITES, CART, FOLLOWS = range(3)
+VERSION_KEY = 'memberships:version:{}'
+MEMBERSHIPS_KEY = 'memberships:{}:{}'
+MEMBERSHIPS_TIMEOUT = 60 * 60
+# Larger changes (e.g. a deleted popular recipe) only invalidate the
+# memberships of the users, which are loaded again when they are needed.
+MAX_WRITE_THROUGH_USERS = 20
+
+
+class UserMemberships:
+    """
+    Ids of the recipes the user has in favorites and in the shopping cart
+    and of the authors the user follows, kept as sorted arrays, so the
+    flags of a whole page are answered with binary searches.
+    """
+    def __init__(self, favorites=(), cart=(), follows=()):
+        self.ids = (array('q', favorites), array('q', cart),
+                    array('q', follows))
+
+    @staticmethod
+    def contains(ids, value):
+        index = bisect_left(ids, value)
+        return index < len(ids) and ids[index] == value
+
+    def is_favorited(self, recipe_id):
+        return self.contains(self.ids[FAVORITES], recipe_id)
+
+    def is_in_shopping_cart(self, recipe_id):
+        return self.contains(self.ids[CART], recipe_id)
+
+    def is_subscribed(self, author_id):
+        return self.contains(self.ids[FOLLOWS], author_id)
+
+    def dumps(self):
+        return tuple(ids.tobytes() for ids in self.ids)
+
+    @classmethod
+    def loads(cls, data):
+        memberships = cls()
+        for ids, chunk in zip(memberships.ids, data):
+            ids.frombytes(chunk)
+        return memberships
+
+    @classmethod
+    def from_database(cls, user_id):
+        """Loads the three lists of ids with a single query."""
+        kind = IntegerField()
+        rows = FavoriteRecipe.objects.filter(user_id=user_id).order_by(
+        ).values_list(Value(FAVORITES, output_field=kind), 'recipe_id').union(
+            RecipeInCart.objects.filter(user_id=user_id).order_by(
+            ).values_list(Value(CART, output_field=kind), 'recipe_id'),
+            Follow.objects.filter(follower_id=user_id).order_by(
+            ).values_list(Value(FOLLOWS, output_field=kind), 'author_id'),
+            all=True,
+        )
+        ids = ([], [], [])
+        for index, value in rows:
+            ids[index].append(value)
+        return cls(*(sorted(values) for values in ids))
+
+
+def load_memberships(user_id):
+    """
+    Returns the memberships of the user from the shared cache or from the
+    database. They are stored under the version of the user, which writes
+    bump before storing what they have loaded after their commit, so a
+    reader which loaded older ids cannot overwrite newer ones. Without a
+    shared cache the version bumped by a write would not reach the other
+    processes, so the memberships are then always loaded from the database.
+    """
+    if not is_cache_shared():
+        return UserMemberships.from_database(user_id)
+    key = MEMBERSHIPS_KEY.format(
+        user_id, get_key_version(VERSION_KEY.format(user_id)))
+    data = cache.get(key)
+    if data is not None:
+        return UserMemberships.loads(data)
+    with read_from_primary():
+        memberships = UserMemberships.from_database(user_id)
+    cache.set(key, memberships.dumps(), MEMBERSHIPS_TIMEOUT)
+    return memberships
+
+
+def get_user_memberships(request):
+    """Returns the memberships of the request user, loaded once."""
+    memberships = getattr(request, 'user_memberships', None)
+    if memberships is None:
+        user = request.user
+        memberships = (UserMemberships() if user.is_anonymous
+                       else load_memberships(user.pk))
+        request.user_memberships = memberships
+    return memberships
+
+
+_local = threading.local()
+
+
+def _publish_pending():
+    user_ids = _local.__dict__.pop('pending', None)
+    if not user_ids:
+        return
+    for user_id in user_ids:
+        version = bump_key_version(VERSION_KEY.format(user_id))
+        if len(user_ids) <= MAX_WRITE_THROUGH_USERS:
+            cache.set(MEMBERSHIPS_KEY.format(user_id, version),
+                      UserMemberships.from_database(user_id).dumps(),
+                      MEMBERSHIPS_TIMEOUT)
+
+
+def update_memberships(user_ids):
+    """
+    Writes the current memberships of the users to the shared cache once
+    the current transaction is committed.
+    """
+    if not is_cache_shared():
+        return
+    _local.__dict__.setdefault('pending', set()).update(user_ids)
+    transaction.on_commit(_publish_pending)
@@ -0,0 +1,283 @@
+import hashlib
+import ipaddress
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.relations import PKOnlyObject
+
+from api.routers import current_replica
+
+logger = logging.getLogger('api.profiling')
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+CLIENT_ADDRESS_HEADER = 'HTTP_X_REAL_IP'
+REPLICA_PATH_PREFIX = '/api/'
+REPLICA_PIN_KEY = 'replica_pin:{}'
+DUPLICATES_IN_LOG = 5
+FIELDS_IN_HEADER = 10
+IN_LIST_RE = re.compile(r'\((?:%s, )+%s\)')
+
+current_profile = ContextVar('current_profile', default=None)
+
+
+def fingerprint(sql):
+    """Returns the sql with lists of placeholders of any length collapsed,
+    so the same query with a different number of ids is counted once."""
+    return IN_LIST_RE.sub('(...)', sql)
+
+
+def get_networks(values):
+    return [ipaddress.ip_network(value, strict=False) for value in values]
+
+
+def in_networks(address, networks):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+def represent_fields(serializer, instance, profile):
+    """
+    The loop of Serializer.to_representation, timing every field. The
+    time of a nested serializer field includes its own fields.
+    """
+    ret = OrderedDict()
+    name = type(serializer).__name__
+    for field in serializer._readable_fields:
+        started = time.perf_counter()
+        try:
+            attribute = field.get_attribute(instance)
+        except SkipField:
+            continue
+        check_for_none = (attribute.pk if isinstance(attribute, PKOnlyObject)
+                          else attribute)
+        if check_for_none is None:
+            ret[field.field_name] = None
+        else:
+            ret[field.field_name] = field.to_representation(attribute)
+        profile.fields['{}.{}'.format(name, field.field_name)] += (
+            time.perf_counter() - started)
+    return ret
+
+
+def profile_serializers():
+    """
+    Wraps Serializer.to_representation once, so the time spent serializing
+    is collected per serializer class and per field for the profiled
+    requests. For the other requests the wrapper only reads a context
+    variable.
+    """
+    to_representation = serializers.Serializer.to_representation
+    if getattr(to_representation, 'profiled', False):
+        return
+
+    @wraps(to_representation)
+    def profiled_to_representation(self, instance):
+        profile = current_profile.get()
+        if profile is None:
+            return to_representation(self, instance)
+        started = time.perf_counter()
+        try:
+            return represent_fields(self, instance, profile)
+        finally:
+            profile.serializers[type(self).__name__] += (
+                time.perf_counter() - started)
+
+    profiled_to_representation.profiled = True
+    serializers.Serializer.to_representation = profiled_to_representation
+
+
+class RequestProfile:
+    """Measurements of a single profiled request."""
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_finished = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+        self.serializers = defaultdict(float)
+        self.fields = defaultdict(float)
+
+    def query_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def duplicates(self):
+        return {sql: count for sql, count in self.fingerprints.items()
+                if count > 1}
+
+    def server_timing(self, total):
+        render = (total - (self.view_finished - self.started)
+                  if self.view_finished else 0.0)
+        metrics = [
+            'total;dur={:.2f}'.format(total * 1000),
+            'db;dur={:.2f};desc="{} queries"'.format(
+                self.db_time * 1000, self.queries),
+            'dup;desc="{} duplicated queries"'.format(
+                sum(count - 1 for count in self.duplicates.values())),
+            'render;dur={:.2f}'.format(render * 1000),
+        ]
+        metrics.extend(
+            'ser-{};dur={:.2f}'.format(name, duration * 1000)
+            for name, duration in sorted(self.serializers.items(),
+                                         key=lambda item: -item[1]))
+        metrics.extend(
+            'field-{};dur={:.2f}'.format(name, duration * 1000)
+            for name, duration in sorted(
+                self.fields.items(),
+                key=lambda item: -item[1])[:FIELDS_IN_HEADER])
+        return ', '.join(metrics)
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in profiling of requests: number of queries, total database time,
+    duplicated queries (N+1 candidates), render time and the time of every
+    serializer (including its nested serializers) and of every serializer
+    field. The results are sent in the Server-Timing header and logged to
+    the api.profiling logger. Every request is profiled with
+    PROFILING_ENABLED, otherwise only requests with the X-Profile header
+    from the PROFILING_TRUSTED_IPS. Behind nginx the client address is
+    taken from the X-Real-IP header, which is trusted only from the
+    PROFILING_TRUSTED_PROXIES. With neither set the middleware is not used.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'PROFILING_ENABLED', False)
+        self.trusted_ips = get_networks(
+            getattr(settings, 'PROFILING_TRUSTED_IPS', ()))
+        self.trusted_proxies = get_networks(
+            getattr(settings, 'PROFILING_TRUSTED_PROXIES', ()))
+        if not self.enabled and not self.trusted_ips:
+            raise MiddlewareNotUsed
+        profile_serializers()
+
+    def get_client_address(self, request):
+        address = request.META.get('REMOTE_ADDR', '')
+        if in_networks(address, self.trusted_proxies):
+            address = request.META.get(CLIENT_ADDRESS_HEADER, address)
+        return address
+
+    def is_profiled(self, request):
+        return self.enabled or (
+            PROFILE_HEADER in request.META
+            and in_networks(self.get_client_address(request),
+                            self.trusted_ips))
+
+    def __call__(self, request):
+        if not self.is_profiled(request):
+            return self.get_response(request)
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(profile.query_wrapper))
+                response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        total = time.perf_counter() - profile.started
+        response['Server-Timing'] = profile.server_timing(total)
+        self.log(request, response, profile, total)
+        return response
+
+    def process_template_response(self, request, response):
+        profile = current_profile.get()
+        if profile is not None:
+            profile.view_finished = time.perf_counter()
+        return response
+
+    def log(self, request, response, profile, total):
+        duplicates = sorted(profile.duplicates.items(),
+                            key=lambda item: -item[1])[:DUPLICATES_IN_LOG]
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'db_ms': round(profile.db_time * 1000, 2),
+            'queries': profile.queries,
+            'duplicated_queries': [{'sql': sql, 'count': count}
+                                   for sql, count in duplicates],
+            'serializers_ms': {name: round(duration * 1000, 2)
+                               for name, duration in
+                               profile.serializers.items()},
+            'fields_ms': {name: round(duration * 1000, 2)
+                          for name, duration in profile.fields.items()},
+        }))
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Routes the reads of safe API requests to a random one of
+    REPLICA_DATABASES (see ReplicaRouter). After a successful write the
+    client is pinned to the primary for REPLICA_PIN_SECONDS, so the next
+    requests read what it has written although the replicas lag behind.
+    Clients are told apart by the Authorization header; a token returned by
+    the login is pinned too, so the first requests with it find the token.
+    With no replicas the middleware is not used.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.replicas = list(getattr(settings, 'REPLICA_DATABASES', ()))
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+        if not self.replicas:
+            raise MiddlewareNotUsed
+
+    @staticmethod
+    def get_pin_key(authorization):
+        return REPLICA_PIN_KEY.format(
+            hashlib.md5(authorization.encode()).hexdigest())
+
+    def is_pinned(self, request):
+        authorization = request.META.get('HTTP_AUTHORIZATION')
+        return (authorization is not None
+                and cache.get(self.get_pin_key(authorization)) is not None)
+
+    def pin(self, request, response):
+        authorizations = [request.META.get('HTTP_AUTHORIZATION')]
+        data = getattr(response, 'data', None)
+        if isinstance(data, dict) and data.get('auth_token'):
+            authorizations.append('Token {}'.format(data['auth_token']))
+        cache.set_many({self.get_pin_key(authorization): True
+                        for authorization in authorizations if authorization},
+                       self.pin_seconds)
+
+    def __call__(self, request):
+        if not request.path.startswith(REPLICA_PATH_PREFIX):
+            return self.get_response(request)
+        if request.method in SAFE_METHODS:
+            if self.is_pinned(request):
+                return self.get_response(request)
+            token = current_replica.set(random.choice(self.replicas))
+            try:
+                return self.get_response(request)
+            finally:
+                current_replica.reset(token)
+        response = self.get_response(request)
+        if response.status_code < 400:
+            self.pin(request, response)
+        return response
@@ -1,5 +1,81 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+def estimate_count(queryset):
+    """
+    Returns the number of rows of the queryset estimated by the PostgreSQL
+    planner, which costs no scan of the table.
+    """
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) {}'.format(sql), params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class ApproximateCountPaginator(Paginator):
+    """
+    Paginator which takes the planner estimate instead of an exact COUNT(*)
+    on PostgreSQL when the estimate exceeds the
+    PAGINATION_APPROXIMATE_COUNT_THRESHOLD setting.
+    """
+    @cached_property
+    def count(self):
+        threshold = getattr(settings,
+                            'PAGINATION_APPROXIMATE_COUNT_THRESHOLD', None)
+        if (threshold is not None and hasattr(self.object_list, 'query')
+                and connections[self.object_list.db].vendor == 'postgresql'):
+            estimate = estimate_count(self.object_list)
+            if estimate > threshold:
+                return estimate
+        return super().count
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor (keyset) pagination which orders on the cursor_ordering of the
+    view (unless the ordering filter of the view asks for another one), so
+    every page is a range scan of an index without OFFSET and without
+    COUNT(*).
+    """
+    page_size = 10
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        self.ordering = getattr(view, 'cursor_ordering', self.ordering)
+        return super().get_ordering(request, queryset, view)
 
 
 class CustomPagination(PageNumberPagination):
+    """
+    Page number pagination with ?page=&limit= parameters. Views which
+    define cursor_ordering switch to keyset pagination when the request
+    has the cursor parameter (an empty value requests the first page).
+    """
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    django_paginator_class = ApproximateCountPaginator
+    keyset_pagination = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (self.cursor_query_param in request.query_params
+                and hasattr(view, 'cursor_ordering')):
+            self.keyset_pagination = KeysetPagination()
+            return self.keyset_pagination.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset_pagination is not None:
+            return self.keyset_pagination.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+from django.core.management.base import CommandError
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('foodgram benchmark')
+    group.addoption('--benchmark', action='store_true',
+                    help='Run the API benchmark after the tests.')
+    group.addoption('--benchmark-output', default=None,
+                    help='Write the benchmark results as json.')
+    group.addoption('--benchmark-budget', default=None,
+                    help='Fail when the benchmark exceeds the budget.')
+    group.addoption('--benchmark-iterations', type=int, default=20)
+    group.addoption('--benchmark-recipes', type=int, default=None)
+
+
+def pytest_configure(config):
+    if config.getoption('benchmark'):
+        import django
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE',
+                              'foodgram_project.settings')
+        django.setup()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    """
+    Runs the benchmark command and fails the session over budget. A run
+    without collected tests succeeds when the budget is met.
+    """
+    config = session.config
+    if not config.getoption('benchmark'):
+        return
+    from django.core.management import call_command
+    options = {'iterations': config.getoption('benchmark_iterations')}
+    if config.getoption('benchmark_recipes'):
+        options['recipes'] = config.getoption('benchmark_recipes')
+    if config.getoption('benchmark_output'):
+        options['output'] = config.getoption('benchmark_output')
+    if config.getoption('benchmark_budget'):
+        options['budget'] = config.getoption('benchmark_budget')
+    try:
+        call_command('benchmark', **options)
+    except CommandError as error:
+        config.get_terminal_writer().line(str(error), red=True)
+        session.exitstatus = pytest.ExitCode.TESTS_FAILED
+        return
+    if exitstatus == pytest.ExitCode.NO_TESTS_COLLECTED:
+        session.exitstatus = pytest.ExitCode.OK
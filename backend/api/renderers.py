@@ -0,0 +1,90 @@
+import csv
+import json
+
+from django.utils.encoding import force_str
+from rest_framework import renderers
+
+
+class ShoppingListRenderer(renderers.BaseRenderer):
+    """
+    Base shopping list renderer. Besides the usual render method used for
+    error responses, every renderer streams the aggregated ingredients
+    chunk by chunk, so the list is never built in memory as a whole.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, dict):
+            data = '\n'.join('{}: {}'.format(key, force_str(value))
+                             for key, value in data.items())
+        return force_str(data).encode(self.charset)
+
+    def stream(self, ingredients):
+        raise NotImplementedError(
+            'ShoppingListRenderer.stream() must be implemented.')
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    """Renders the shopping list as plain text, one ingredient per line."""
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients):
+        separator = ''
+        for ingredient in ingredients:
+            yield '{}{} ({}) - {}'.format(
+                separator, ingredient['name'], ingredient['units'],
+                ingredient['amount'])
+            separator = '\n'
+
+
+class EchoBuffer:
+    """A file-like object which returns the written value instead of
+    storing it, used to stream the csv writer output."""
+    def write(self, value):
+        return value
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    """Renders the shopping list as csv with a header row."""
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(EchoBuffer())
+        yield writer.writerow(('name', 'measurement_unit', 'amount'))
+        for ingredient in ingredients:
+            yield writer.writerow((ingredient['name'], ingredient['units'],
+                                   ingredient['amount']))
+
+
+class JSONShoppingListRenderer(ShoppingListRenderer):
+    """Renders the shopping list as a json array of ingredients."""
+    media_type = 'application/json'
+    format = 'json'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data).encode(self.charset)
+
+    def stream(self, ingredients):
+        separator = '['
+        for ingredient in ingredients:
+            yield separator + json.dumps({
+                'name': ingredient['name'],
+                'measurement_unit': ingredient['units'],
+                'amount': ingredient['amount'],
+            })
+            separator = ','
+        yield '[]' if separator == '[' else ']'
+
+
+# The first renderer is used when the client does not ask for a format.
+SHOPPING_LIST_RENDERERS = (
+    TextShoppingListRenderer,
+    CSVShoppingListRenderer,
+    JSONShoppingListRenderer,
+)
@@ -0,0 +1,41 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# The replica the reads of the current request go to, set by
+# ReplicaRoutingMiddleware for the safe requests of clients which are not
+# pinned to the primary.
+current_replica = ContextVar('current_replica', default=None)
+
+
+@contextmanager
+def read_from_primary():
+    """
+    Sends the reads of the block to the primary. Used by the reads which
+    fill caches and indexes keyed by a version: the version is bumped by a
+    write on the primary, and a lagging replica would store the old rows
+    under the new version.
+    """
+    token = current_replica.set(None)
+    try:
+        yield
+    finally:
+        current_replica.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of safe API requests to a read replica. Everything else
+    (writes, reads of unsafe requests, management commands and workers) uses
+    the primary, so a request always reads what it has written.
+    """
+    def db_for_read(self, model, **hints):
+        return current_replica.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -1,12 +1,21 @@
+import json
+
 from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer
-from drf_extra_fields.fields import Base64ImageField
+from drf_extra_fields.fields import Base64FieldMixin, Base64ImageField
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
+from rest_framework.utils import html
 
-from api.utils import get_obj_of_current_user
+from api.matching import recipe_matching_index
+from api.utils import get_obj_of_current_user, get_recipes_limit
+from recipes.images import get_rendition_names
 from recipes.models import (FavoriteRecipe, Follow, IngredientInRecipe,
                             Ingredients, RecipeInCart, Recipes, Tags,)
+from recipes.search import update_search_index
+from recipes.shopping_list import update_recipe_ingredients
 
 User = get_user_model()
 
@@ -21,6 +30,9 @@ class CustomUserSerializer(serializers.ModelSerializer):
                   'is_subscribed',)
 
     def get_is_subscribed(self, obj):
+        is_subscribed = getattr(obj, 'is_subscribed', None)
+        if is_subscribed is not None:
+            return is_subscribed
         return get_obj_of_current_user(self, obj, Follow, 'exists')
 
 
@@ -79,6 +91,47 @@ class IngredientsCreateSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount',)
 
 
+class ImageUploadField(Base64ImageField):
+    """
+    The image field which accepts a base64 string in json requests as well
+    as an uploaded file in multipart requests.
+    """
+    def to_internal_value(self, data):
+        if not isinstance(data, UploadedFile):
+            return super().to_internal_value(data)
+        image = super(Base64FieldMixin, self).to_internal_value(data)
+        if image.image.format.lower() not in self.ALLOWED_TYPES:
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        return image
+
+
+class ImageRenditionsField(serializers.Field):
+    """
+    Represents urls of the resized renditions of the recipe image, or None
+    while the image is not processed yet.
+    """
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        value = instance.image
+        if not value or instance.image_status != Recipes.IMAGE_READY:
+            return None
+        request = self.context.get('request')
+        storage = value.storage
+        renditions = {}
+        for rendition, names in get_rendition_names(value.name).items():
+            renditions[rendition] = {}
+            for extension, name in names.items():
+                url = storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                renditions[rendition][extension] = url
+        return renditions
+
+
 class RecipesSerializer(serializers.ModelSerializer):
     """Base recipes serializer."""
     tags = TagPrimaryKeyRelatedSerializer(queryset=Tags.objects.all(),
@@ -89,20 +142,41 @@ class RecipesSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField()
+    image_renditions = ImageRenditionsField()
 
     class Meta:
         model = Recipes
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
                   'is_in_shopping_cart', 'name', 'text', 'image',
-                  'cooking_time',)
+                  'image_status', 'image_renditions', 'cooking_time',)
+        read_only_fields = ('image_status',)
 
     def get_is_favorited(self, obj):
+        is_favorited = getattr(obj, 'is_favorited', None)
+        if is_favorited is not None:
+            return is_favorited
         return get_obj_of_current_user(self, obj, FavoriteRecipe, 'exists')
 
     def get_is_in_shopping_cart(self, obj):
+        is_in_shopping_cart = getattr(obj, 'is_in_shopping_cart', None)
+        if is_in_shopping_cart is not None:
+            return is_in_shopping_cart
         return get_obj_of_current_user(self, obj, RecipeInCart, 'exists')
 
 
+class RecipeMatchSerializer(RecipesSerializer):
+    """
+    Recipes serializer with the numbers of the recipe ingredients which
+    the requested set has and misses.
+    """
+    matched_ingredients = serializers.IntegerField(read_only=True)
+    missing_ingredients = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipesSerializer.Meta):
+        fields = RecipesSerializer.Meta.fields + ('matched_ingredients',
+                                                  'missing_ingredients',)
+
+
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """
     A recipe serializer used to create or modify a recipe. Redefined
@@ -112,12 +186,33 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                                           many=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = IngredientsCreateSerializer(many=True)
-    image = Base64ImageField()
+    image = ImageUploadField()
 
     class Meta:
         model = Recipes
         fields = ('id', 'tags', 'author', 'ingredients', 'name', 'text',
-                  'image', 'cooking_time',)
+                  'image', 'image_status', 'cooking_time',)
+        read_only_fields = ('image_status',)
+
+    def to_internal_value(self, data):
+        """
+        Multipart requests send the image as a file, the ingredients as a
+        json array and the tags as repeated fields or a json array.
+        """
+        if html.is_html_input(data):
+            tags = data.getlist('tags')
+            data = data.dict()
+            try:
+                if len(tags) == 1 and tags[0].startswith('['):
+                    tags = json.loads(tags[0])
+                if 'ingredients' in data:
+                    data['ingredients'] = json.loads(data['ingredients'])
+            except ValueError:
+                raise ValidationError(
+                    {'detail': 'Tags and ingredients must be json arrays.'})
+            if tags:
+                data['tags'] = tags
+        return super().to_internal_value(data)
 
     def validate(self, data):
         ingredients = data.get('ingredients')
@@ -134,13 +229,49 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         return data
 
     def create_ingredients(self, ingredients, recipe):
-        for ingredient in ingredients:
-            IngredientInRecipe.objects.create(
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
                 recipe=recipe,
                 ingredient=ingredient.get('id'),
                 amount=ingredient.get('amount'),
-            )
+            ) for ingredient in ingredients
+        )
 
+    def update_ingredients(self, ingredients, recipe):
+        """
+        Applies only the difference between the current ingredients of the
+        recipe and the new ones: creates the added, updates the changed
+        amounts and deletes the removed rows. The shopping lists of the users
+        who have the recipe in the cart get the same difference; the deleted
+        rows update them through the post_delete signal.
+        """
+        current = {obj.ingredient_id: obj for obj in
+                   IngredientInRecipe.objects.filter(recipe=recipe)}
+        to_create = []
+        to_update = []
+        changes = {}
+        for ingredient in ingredients:
+            obj = current.pop(ingredient.get('id').pk, None)
+            if obj is None:
+                to_create.append(ingredient)
+                changes[ingredient.get('id').pk] = (ingredient.get('amount'),
+                                                    1)
+            elif obj.amount != ingredient.get('amount'):
+                changes[obj.ingredient_id] = (
+                    ingredient.get('amount') - (obj.amount or 0), 0)
+                obj.amount = ingredient.get('amount')
+                to_update.append(obj)
+        if current:
+            IngredientInRecipe.objects.filter(
+                pk__in=[obj.pk for obj in current.values()]).delete()
+        if to_update:
+            IngredientInRecipe.objects.bulk_update(to_update, ('amount',))
+        if to_create:
+            self.create_ingredients(to_create, recipe)
+            recipe_matching_index.update([recipe.pk])
+        update_recipe_ingredients(recipe.pk, changes)
+
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
         tags = validated_data.pop('tags')
@@ -153,25 +284,38 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         )
         recipe.tags.set(tags)
         self.create_ingredients(ingredients, recipe)
+        recipe_matching_index.update([recipe.pk])
+        update_search_index([recipe.pk])
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.tags.clear()
         tags = validated_data.pop('tags')
         instance.tags.set(tags)
-        IngredientInRecipe.objects.filter(recipe=instance).delete()
         ingredients = validated_data.pop('ingredients')
-        self.create_ingredients(ingredients, instance)
-        return super().update(instance, validated_data)
+        self.update_ingredients(ingredients, instance)
+        instance = super().update(instance, validated_data)
+        update_search_index([instance.pk])
+        return instance
+
+
+class RecipeImageSerializer(serializers.ModelSerializer):
+    """A serializer to replace the image of a recipe."""
+    image = ImageUploadField()
+
+    class Meta:
+        model = Recipes
+        fields = ('image',)
 
 
 class ShortRecipesSerializer(serializers.ModelSerializer):
     """Short recipe serializer to display user's recipes."""
     image = Base64ImageField(read_only=True)
+    image_renditions = ImageRenditionsField()
 
     class Meta:
         model = Recipes
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'cooking_time')
 
 
 class FollowSerializer(serializers.ModelSerializer):
@@ -191,16 +335,24 @@ class FollowSerializer(serializers.ModelSerializer):
                   'is_subscribed', 'recipes', 'recipes_count',)
 
     def get_recipes(self, obj):
-        recipes_limit = self.context['request'].GET.get('recipes_limit')
-        query = obj.author.recipes.all()
-        if recipes_limit:
-            query = query[:int(recipes_limit)]
+        query = getattr(obj.author, 'limited_recipes', None)
+        if query is None:
+            query = obj.author.recipes.all()
+            recipes_limit = get_recipes_limit(self.context['request'])
+            if recipes_limit:
+                query = query[:recipes_limit]
         return ShortRecipesSerializer(instance=query, many=True).data
 
     def get_is_subscribed(self, obj):
+        is_subscribed = getattr(obj, 'is_subscribed', None)
+        if is_subscribed is not None:
+            return is_subscribed
         return get_obj_of_current_user(self, obj.author, Follow, 'exists')
 
     def get_recipes_count(self, obj):
+        recipes_count = getattr(obj, 'recipes_count', None)
+        if recipes_count is not None:
+            return recipes_count
         return get_obj_of_current_user(self, obj.author, Recipes, 'count')
 
     def validate(self, data):
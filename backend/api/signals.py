@@ -0,0 +1,190 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import request_started
+from django.db import connections
+from django.db.models import F
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_save,)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import invalidate_tokens
+from api.cache import schedule_key_version_bump, schedule_version_bump
+from api.matching import recipe_matching_index
+from api.membership import update_memberships
+from api.utils import SHOPPING_LIST_VERSION_KEY
+from recipes.models import (FavoriteRecipe, Follow, IngredientInRecipe,
+                            Ingredients, RecipeInCart, Recipes, Tags,)
+from recipes.search import (create_search_vector_index,
+                            schedule_search_index_update, update_search_index,)
+from recipes.shopping_list import update_cart_recipe, update_ingredient_row
+from recipes.signals import ingredients_loaded, shopping_lists_changed
+
+User = get_user_model()
+
+COUNTER_FIELDS = {
+    FavoriteRecipe: 'favorites_count',
+    RecipeInCart: 'cart_count',
+}
+
+
+@receiver((post_save, post_delete, ingredients_loaded), sender=Ingredients)
+@receiver((post_save, post_delete), sender=Tags)
+def bump_catalog_version(sender, **kwargs):
+    schedule_version_bump(sender)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_tokens_on_logout(sender, instance, **kwargs):
+    invalidate_tokens(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_tokens_on_user_change(sender, instance, created,
+                                     update_fields=None, **kwargs):
+    """
+    The cached tokens hold the user, so a changed password, deactivation
+    or profile invalidates them; the login only updates last_login.
+    """
+    if not created and (update_fields is None
+                        or set(update_fields) != {'last_login'}):
+        invalidate_tokens(instance.pk)
+
+
+@receiver(shopping_lists_changed)
+def invalidate_shopping_lists(sender, user_ids, **kwargs):
+    for user_id in user_ids:
+        schedule_key_version_bump(SHOPPING_LIST_VERSION_KEY.format(user_id))
+
+
+@receiver(post_save, sender=Ingredients)
+def update_ingredient_recipes_search(sender, instance, created, **kwargs):
+    """Reindexes the recipes with the ingredient, its name may change."""
+    if not created:
+        update_search_index(IngredientInRecipe.objects.filter(
+            ingredient=instance).values_list('recipe_id', flat=True))
+
+
+@receiver((post_save, post_delete), sender=IngredientInRecipe)
+def update_recipe_indexes(sender, instance, **kwargs):
+    """
+    Row by row changes, e.g. of the admin or deleted recipes; the
+    serializer creates and updates the rows in bulk and updates the
+    indexes itself.
+    """
+    recipe_matching_index.update([instance.recipe_id])
+    schedule_search_index_update([instance.recipe_id])
+
+
+@receiver(pre_save, sender=IngredientInRecipe)
+def remember_ingredient_row(sender, instance, **kwargs):
+    """Keeps the stored values of a changed row for the shopping lists."""
+    instance.stored_row = None
+    if instance.pk is not None:
+        instance.stored_row = sender.objects.filter(
+            pk=instance.pk).values_list(
+            'recipe_id', 'ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+def update_shopping_lists_on_save(sender, instance, **kwargs):
+    update_ingredient_row(
+        getattr(instance, 'stored_row', None),
+        (instance.recipe_id, instance.ingredient_id, instance.amount))
+
+
+@receiver(post_delete, sender=IngredientInRecipe)
+def update_shopping_lists_on_delete(sender, instance, **kwargs):
+    update_ingredient_row(
+        (instance.recipe_id, instance.ingredient_id, instance.amount), None)
+
+
+@receiver(post_delete, sender=Ingredients)
+def invalidate_recipe_matching(sender, **kwargs):
+    recipe_matching_index.invalidate()
+
+
+def track_connection_use(execute, sql, params, many, context):
+    context['connection'].last_used = time.monotonic()
+    return execute(sql, params, many, context)
+
+
+@receiver(request_started)
+def check_database_connections(**kwargs):
+    """
+    Closes the persistent connections which broke while idle (e.g. the
+    database or pgbouncer restarted), so the request opens a new one
+    instead of failing on its first query. Only the connections unused for
+    longer than DB_CONN_HEALTH_CHECK_IDLE seconds are checked, so busy
+    connections do not pay a round trip per request. Runs after Django has
+    closed the connections older than CONN_MAX_AGE.
+    """
+    if not settings.DB_CONN_HEALTH_CHECKS:
+        return
+    now = time.monotonic()
+    for connection in connections.all():
+        if track_connection_use not in connection.execute_wrappers:
+            connection.execute_wrappers.append(track_connection_use)
+        if (connection.connection is None
+                or now - getattr(connection, 'last_used', 0)
+                <= settings.DB_CONN_HEALTH_CHECK_IDLE):
+            continue
+        if connection.is_usable():
+            connection.last_used = now
+        else:
+            connection.close()
+
+
+@receiver(post_migrate)
+def create_search_index(sender, using, **kwargs):
+    if sender.label == 'recipes':
+        create_search_vector_index(using)
+
+
+def update_recipe_counter(model, recipe_id, delta):
+    """Atomically changes the denormalized counter of the recipe."""
+    field = COUNTER_FIELDS[model]
+    Recipes.objects.filter(pk=recipe_id).update(**{field: F(field) + delta})
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_save, sender=RecipeInCart)
+def increment_recipe_counter(sender, instance, created, **kwargs):
+    if created:
+        update_recipe_counter(sender, instance.recipe_id, 1)
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_delete, sender=RecipeInCart)
+def decrement_recipe_counter(sender, instance, **kwargs):
+    update_recipe_counter(sender, instance.recipe_id, -1)
+
+
+@receiver(post_save, sender=RecipeInCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        update_cart_recipe(instance.user_id, instance.recipe_id, 1)
+
+
+@receiver(post_delete, sender=RecipeInCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    """
+    Removes the ingredient rows which still exist. When the recipe itself
+    is deleted, its cart entries and ingredient rows are deleted in two
+    batches: whichever goes first updates the shopping lists and the
+    second one finds nothing left to remove.
+    """
+    update_cart_recipe(instance.user_id, instance.recipe_id, -1)
+
+
+@receiver((post_save, post_delete), sender=FavoriteRecipe)
+@receiver((post_save, post_delete), sender=RecipeInCart)
+def update_recipe_memberships(sender, instance, **kwargs):
+    update_memberships([instance.user_id])
+
+
+@receiver((post_save, post_delete), sender=Follow)
+def update_follow_memberships(sender, instance, **kwargs):
+    update_memberships([instance.follower_id])
@@ -0,0 +1,188 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (FavoriteRecipe, Follow, IngredientInRecipe,
+                            Ingredients, RecipeInCart, Recipes, Tags,)
+
+User = get_user_model()
+
+# A replica mirroring the default test database, registered before the test
+# databases are set up, so the routing is tested without DB_REPLICAS.
+TEST_REPLICA = 'test_replica'
+connections.databases.setdefault(TEST_REPLICA, dict(
+    connections.databases['default'], TEST={'MIRROR': 'default'}))
+
+
+class RecipesQueriesTest(TestCase):
+    """
+    The number of queries of the recipes endpoints must not grow with the
+    page size or with the number of tags and ingredients of a recipe.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='p')
+        authors = [
+            User.objects.create_user(
+                username='author{}'.format(index),
+                email='author{}@example.com'.format(index), password='p')
+            for index in range(3)]
+        Follow.objects.create(follower=cls.user, author=authors[0])
+        tags = [Tags.objects.create(name='tag{}'.format(index),
+                                    color='#00000{}'.format(index),
+                                    slug='tag{}'.format(index))
+                for index in range(3)]
+        ingredients = [
+            Ingredients.objects.create(name='ingredient{}'.format(index),
+                                       measurement_unit='g')
+            for index in range(8)]
+        cls.recipes = []
+        for index in range(12):
+            recipe = Recipes.objects.create(
+                name='recipe{}'.format(index), author=authors[index % 3],
+                text='text', cooking_time=10, image='recipes/images/a.png')
+            recipe.tags.set(tags[:index % 3 + 1])
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(recipe=recipe, ingredient=ingredient,
+                                   amount=index + 1)
+                for ingredient in ingredients[:2 + index % 7])
+            cls.recipes.append(recipe)
+        for recipe in cls.recipes[::2]:
+            FavoriteRecipe.objects.create(user=cls.user, recipe=recipe)
+            RecipeInCart.objects.create(user=cls.user, recipe=recipe)
+        # A small and a large recipe, neither in favorites nor in the cart.
+        cls.small = cls.recipes[7]
+        cls.large = cls.recipes[5]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_same_queries(self, num, requests):
+        for method, url, status in requests:
+            with self.subTest(method=method, url=url):
+                with self.assertNumQueries(num):
+                    response = getattr(self.client, method)(url)
+                self.assertEqual(response.status_code, status)
+
+    def test_list(self):
+        self.assert_same_queries(6, (
+            ('get', '/api/recipes/?limit=2', 200),
+            ('get', '/api/recipes/?limit=10', 200),
+        ))
+
+    def test_list_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assert_same_queries(5, (
+            ('get', '/api/recipes/?limit=2', 200),
+            ('get', '/api/recipes/?limit=10', 200),
+        ))
+
+    def test_retrieve(self):
+        self.assert_same_queries(5, (
+            ('get', '/api/recipes/{}/'.format(self.small.pk), 200),
+            ('get', '/api/recipes/{}/'.format(self.large.pk), 200),
+        ))
+
+    def test_favorite(self):
+        # The writes include the SAVEPOINT and RELEASE of their transaction.
+        self.assert_same_queries(7, (
+            ('post', '/api/recipes/{}/favorite/'.format(self.small.pk), 201),
+            ('post', '/api/recipes/{}/favorite/'.format(self.large.pk), 201),
+        ))
+        self.assert_same_queries(8, (
+            ('delete', '/api/recipes/{}/favorite/'.format(self.small.pk),
+             204),
+            ('delete', '/api/recipes/{}/favorite/'.format(self.large.pk),
+             204),
+        ))
+
+    def test_shopping_cart(self):
+        self.assert_same_queries(11, (
+            ('post', '/api/recipes/{}/shopping_cart/'.format(self.small.pk),
+             201),
+            ('post', '/api/recipes/{}/shopping_cart/'.format(self.large.pk),
+             201),
+        ))
+        self.assert_same_queries(12, (
+            ('delete',
+             '/api/recipes/{}/shopping_cart/'.format(self.small.pk), 204),
+            ('delete',
+             '/api/recipes/{}/shopping_cart/'.format(self.large.pk), 204),
+        ))
+
+
+@override_settings(REPLICA_DATABASES=[TEST_REPLICA])
+class ReplicaRoutingTest(TransactionTestCase):
+    """
+    Safe API requests read from the replica, unsafe ones and the requests
+    of a client which has just written use the primary.
+    """
+    databases = {'default', TEST_REPLICA}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='p')
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='p')
+        Tags.objects.create(name='tag', color='#000000', slug='tag')
+        self.recipe = Recipes.objects.create(
+            name='recipe', author=author, text='text', cooking_time=10,
+            image='recipes/images/a.png')
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+    def request(self, client, method, url, **kwargs):
+        """Returns the response and the number of queries per database."""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[TEST_REPLICA]) as replica:
+            response = getattr(client, method)(url, **kwargs)
+        return response, len(primary), len(replica)
+
+    def assert_reads(self, database, client, method, url, status=200,
+                     **kwargs):
+        response, primary, replica = self.request(client, method, url,
+                                                  **kwargs)
+        self.assertEqual(response.status_code, status)
+        if database == TEST_REPLICA:
+            self.assertGreater(replica, 0)
+            self.assertEqual(primary, 0)
+        else:
+            self.assertGreater(primary, 0)
+            self.assertEqual(replica, 0)
+        return response
+
+    def test_safe_request_reads_from_replica(self):
+        self.assert_reads(TEST_REPLICA, self.client, 'get', '/api/recipes/')
+        self.assert_reads(TEST_REPLICA, APIClient(), 'get', '/api/recipes/')
+
+    def test_unsafe_request_uses_primary(self):
+        self.assert_reads(
+            'default', self.client, 'post',
+            '/api/recipes/{}/favorite/'.format(self.recipe.pk), status=201)
+
+    def test_client_is_pinned_after_write(self):
+        self.client.post('/api/recipes/{}/favorite/'.format(self.recipe.pk))
+        self.assert_reads('default', self.client, 'get', '/api/users/me/')
+        self.assert_reads(TEST_REPLICA, APIClient(), 'get', '/api/recipes/')
+
+    def test_token_of_login_is_pinned(self):
+        response = APIClient().post(
+            '/api/auth/token/login/',
+            {'email': 'reader@example.com', 'password': 'p'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION='Token ' + response.data['auth_token'])
+        self.assert_reads('default', client, 'get', '/api/users/me/')
+
+    def test_versioned_caches_are_filled_from_primary(self):
+        self.assert_reads('default', APIClient(), 'get', '/api/tags/')
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class ImageTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'The image is too large.'
+    default_code = 'image_too_large'
+
+
+class LimitedUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams every uploaded file chunk by chunk into a temporary file, which
+    the file system storage then moves in place instead of copying, and
+    stops the upload as soon as a file exceeds IMAGE_UPLOAD_MAX_SIZE.
+    """
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+
+    def handle_raw_input(self, input_data, meta, content_length, boundary,
+                         encoding=None):
+        """Rejects a request whose declared length cannot fit the limits
+        without reading it."""
+        fields_size = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        if (fields_size is not None
+                and content_length > self.max_size + fields_size):
+            raise ImageTooLarge()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_size:
+            self.file.close()
+            raise ImageTooLarge()
+        return super().receive_data_chunk(raw_data, start)
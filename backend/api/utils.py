@@ -1,37 +1,55 @@
-from django.db import IntegrityError
-from django.db.models import F, Sum
-from django.http import HttpResponse
+import hashlib
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import (BooleanField, Count, F, OuterRef, Prefetch, Q,
+                              Subquery, Sum, Value,)
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
-from recipes.models import (FavoriteRecipe, Follow, IngredientInRecipe,
-                            RecipeInCart, Recipes,)
+from api.cache import (RESPONSE_CACHE_TIMEOUT, get_key_version, get_version,
+                       is_cache_shared,)
+from api.membership import get_user_memberships
+from api.routers import read_from_primary
+from recipes.models import (FavoriteRecipe, Follow, Ingredients, RecipeInCart,
+                            RecipeNeighbour, Recipes, ShoppingListItem,)
+from recipes.units import annotate_canonical_units
+
+CHUNK_SIZE = 2000
+MATCH_MAX_INGREDIENTS = 100
+SHOPPING_LIST_VERSION_KEY = 'shopping_list:version:{}'
 
 
 def add_delete_obj(request, pk, serializer_obj, model_obj):
     """
     Performs the addition or removal (depending on the method) of an object
     based on the serialized data. Changes output data according to
-    ShortRecipesSerializer.
+    ShortRecipesSerializer. The object is written in one transaction with
+    the counters and the shopping list it updates, so a failed write leaves
+    none of them changed.
     """
-    recipe = Recipes.objects.get(pk=pk)
+    recipe = get_object_or_404(Recipes, pk=pk)
     data = {'user': request.user.pk, 'recipe': recipe.pk}
     serializer = serializer_obj(context={'request': request}, data=data)
     serializer.is_valid(raise_exception=True)
     if request.method == 'POST':
         try:
-            serializer.save()
-            short_query = Recipes.objects.get(pk=recipe.pk)
+            with transaction.atomic():
+                serializer.save()
             from api.serializers import ShortRecipesSerializer
-            returned_data = ShortRecipesSerializer(instance=short_query)
+            returned_data = ShortRecipesSerializer(instance=recipe)
             return Response(returned_data.data, status=status.HTTP_201_CREATED)
         except IntegrityError:
             raise ValidationError({'errors': 'Recipe already added.'})
     elif request.method == 'DELETE':
-        obj_to_delete = model_obj.objects.filter(**data)
-        if obj_to_delete.exists():
-            obj_to_delete.delete()
+        with transaction.atomic():
+            deleted, _ = model_obj.objects.filter(**data).delete()
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response({'errors': 'No such object.'},
                         status=status.HTTP_400_BAD_REQUEST)
@@ -39,52 +57,214 @@ def add_delete_obj(request, pk, serializer_obj, model_obj):
                     status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
 
+def get_recipes_limit(request):
+    """
+    Returns the recipes_limit query parameter as a positive integer or None
+    when it is missing or invalid.
+    """
+    try:
+        recipes_limit = int(request.GET.get('recipes_limit'))
+    except (TypeError, ValueError):
+        return None
+    return recipes_limit if recipes_limit > 0 else None
+
+
+def get_match_params(request):
+    """
+    Returns the ingredient ids of the ingredients query parameter (repeated
+    or comma separated) and the max_missing parameter or None.
+    """
+    values = ','.join(request.query_params.getlist('ingredients'))
+    try:
+        ingredient_ids = {int(value) for value in values.split(',') if value}
+        max_missing = request.query_params.get('max_missing')
+        max_missing = int(max_missing) if max_missing else None
+    except ValueError:
+        raise ValidationError({'errors': 'ingredients and max_missing must '
+                                         'be integers.'})
+    if not ingredient_ids or len(ingredient_ids) > MATCH_MAX_INGREDIENTS:
+        raise ValidationError({'errors': 'Pass from 1 to {} ingredients.'
+                                         .format(MATCH_MAX_INGREDIENTS)})
+    if max_missing is not None and max_missing < 0:
+        raise ValidationError({'errors': 'max_missing cannot be negative.'})
+    return ingredient_ids, max_missing
+
+
+def get_recommended_queryset(queryset, user):
+    """
+    Returns the recipes queryset ordered by the sum of similarities to the
+    recipes the user has in favorites or in the shopping cart, which are
+    excluded. Without favorites and carts the most popular recipes are
+    recommended.
+    """
+    favorites = FavoriteRecipe.objects.filter(user=user).values('recipe')
+    carted = RecipeInCart.objects.filter(user=user).values('recipe')
+    scores = RecipeNeighbour.objects.filter(
+        Q(recipe__in=favorites) | Q(recipe__in=carted),
+    ).exclude(neighbour__in=favorites).exclude(neighbour__in=carted).order_by(
+    ).values('neighbour').annotate(score=Sum('score'))
+    if not scores.exists():
+        return queryset.exclude(pk__in=favorites).exclude(
+            pk__in=carted).order_by('-favorites_count', '-pub_date', '-id')
+    return queryset.filter(pk__in=scores.values('neighbour')).annotate(
+        recommendation_score=Subquery(scores.filter(
+            neighbour=OuterRef('pk')).values('score')),
+    ).order_by('-recommendation_score', '-pub_date', '-id')
+
+
+def get_follows_queryset(request):
+    """
+    Returns the follows of the user who made the request with the number of
+    recipes of every author annotated and the (limited) recipes of all
+    authors of the page prefetched in a single query.
+    """
+    recipes = Recipes.objects.all()
+    recipes_limit = get_recipes_limit(request)
+    if recipes_limit:
+        latest_recipes = Recipes.objects.filter(
+            author=OuterRef('author')).values('pk')[:recipes_limit]
+        recipes = recipes.filter(pk__in=Subquery(latest_recipes))
+    return Follow.objects.filter(follower=request.user).select_related(
+        'author').annotate(
+        recipes_count=Count('author__recipes'),
+        is_subscribed=Value(True, output_field=BooleanField()),
+    ).prefetch_related(
+        Prefetch('author__recipes', queryset=recipes,
+                 to_attr='limited_recipes')).order_by('id')
+
+
 def get_obj_of_current_user(serializer, instance, model, method):
     """
     Returns the boolean value of the existence of an instance in the
     database when using the exists method. With the count method, it counts
     the number of instance entity objects.
     """
-    user = serializer.context.get('request').user
-    if user.is_anonymous:
+    request = serializer.context.get('request')
+    if request.user.is_anonymous:
         return False
     if method == 'exists':
+        memberships = get_user_memberships(request)
         if model is Follow:
-            return model.objects.filter(follower=user,
-                                        author=instance).exists()
+            return memberships.is_subscribed(instance.pk)
         elif model is RecipeInCart:
-            return model.objects.filter(user=user, recipe=instance).exists()
+            return memberships.is_in_shopping_cart(instance.pk)
         elif model is FavoriteRecipe:
-            return model.objects.filter(user=user, recipe=instance).exists()
+            return memberships.is_favorited(instance.pk)
     elif method == 'count':
         if model is Recipes:
             return model.objects.filter(author=instance).count()
     return False
 
 
+def get_catalog_units():
+    """
+    Returns the distinct measurement units of the ingredients catalog,
+    cached until the catalog changes.
+    """
+    key = 'catalog_units:{}'.format(get_version(Ingredients))
+    units = cache.get(key)
+    if units is None:
+        with read_from_primary():
+            units = list(Ingredients.objects.order_by().values_list(
+                'measurement_unit', flat=True).distinct())
+        cache.set(key, units, RESPONSE_CACHE_TIMEOUT)
+    return units
+
+
+def get_shopping_list(user):
+    """
+    Returns the materialized shopping list of the user with the amounts of
+    the same ingredient in convertible units (g and kg, tsp. and tbsp.)
+    summed in the canonical unit, the largest amounts first.
+    """
+    items = annotate_canonical_units(
+        ShoppingListItem.objects.filter(user=user),
+        'ingredient__measurement_unit', 'amount', get_catalog_units())
+    return items.values(
+        name=F('ingredient__name'), units=F('canonical_unit'),
+    ).annotate(amount=Sum('canonical_amount')).order_by('-amount', 'name')
+
+
+def get_shopping_cart_etag(renderer, items, *extra):
+    """
+    Returns an ETag of the user's shopping list. It is a hash of the
+    aggregated rows which are sent to the client and of the extra values,
+    so any change of the amounts, units or ingredient names gives a new tag.
+    """
+    digest = hashlib.md5('{}:{}'.format(renderer.format, extra).encode())
+    for item in items:
+        digest.update(repr(tuple(item.values())).encode())
+    return quote_etag(digest.hexdigest())
+
+
+def get_shopping_list_etag(renderer, user):
+    """
+    Returns an ETag of the user's shopping list built from the version of
+    the list, bumped when its items change, and the version of the
+    ingredients catalog, which holds their names and units, so an unchanged
+    list is answered without reading it.
+    """
+    return get_shopping_cart_etag(
+        renderer, (),
+        get_key_version(SHOPPING_LIST_VERSION_KEY.format(user.pk)),
+        get_version(Ingredients))
+
+
 def download_shopping_cart(request):
     """
-    A .txt file with a shopping list for the user who sent the request is
-    sent to the response.
+    A file with a shopping list for the user who sent the request is
+    streamed to the response in the format chosen by the accepted renderer
+    (plain text by default). Repeated downloads of an unchanged list are
+    answered with 304 Not Modified. With a shared cache the tag comes from
+    the list version and the list is streamed from the primary, which the
+    version describes; otherwise a version bumped in another process would
+    not be seen, so the list is read first and the tag is a hash of it.
     """
     user = request.user
-    name = 'ingredient__name'
-    units = 'ingredient__measurement_unit'
-    amount = 'amount'
-    result_list = []
-
-    ingredients = IngredientInRecipe.objects.filter(
-        recipe__recipe_in_cart__user=user).order_by(name)
-    ingredient_list = ingredients.values(name, units).annotate(
-        name=F(name), units=F(units), amount=Sum(amount)).order_by('-amount')
-    for ingredient in ingredient_list:
-        result_list.append('{} ({}) - {}'.format(
-            ingredient.get(name), ingredient.get(units), ingredient.get(amount)
-        ))
-
-    file_name = '{}_shop_list.txt'.format(request.user)
-    response = HttpResponse('\n'.join(result_list), status=None)
-    response['Content-Type'] = 'text/plain'
+    renderer = request.accepted_renderer
+
+    if is_cache_shared():
+        etag = get_shopping_list_etag(renderer, user)
+        ingredient_list = None
+    else:
+        ingredient_list = list(get_shopping_list(user))
+        etag = get_shopping_cart_etag(renderer, ingredient_list)
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
+    if ingredient_list is None:
+        ingredient_list = get_shopping_list(user).using(
+            DEFAULT_DB_ALIAS).iterator(chunk_size=CHUNK_SIZE)
+
+    file_name = '{}_shop_list.{}'.format(request.user, renderer.format)
+    response = StreamingHttpResponse(renderer.stream(ingredient_list))
+    response['Content-Type'] = '{}; charset={}'.format(
+        renderer.media_type, renderer.charset)
     response['Content-Disposition'] = 'attachment; filename={}'.format(
         file_name)
+    response['ETag'] = etag
+    return response
+
+
+def shopping_cart_summary(request):
+    """
+    Returns the number of recipes in the shopping cart of the user and the
+    shopping list as json, answering 304 Not Modified for an unchanged cart.
+    """
+    user = request.user
+    recipes_count = RecipeInCart.objects.filter(user=user).count()
+    items = list(get_shopping_list(user))
+    etag = get_shopping_cart_etag(request.accepted_renderer, items,
+                                  recipes_count)
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
+    response = Response({
+        'recipes_count': recipes_count,
+        'ingredients': [
+            {'name': item['name'], 'measurement_unit': item['units'],
+             'amount': item['amount']}
+            for item in items],
+    })
+    response['ETag'] = etag
     return response
@@ -1,27 +1,36 @@
 from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
-from rest_framework.permissions import (IsAuthenticated,
+from rest_framework.parsers import FileUploadParser, MultiPartParser
+from rest_framework.permissions import (SAFE_METHODS, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly,)
 from rest_framework.response import Response
 
-from api.filters import IngredientsFilter, RecipesFilter
+from api.cache import CachedResponseMixin
+from api.filters import IngredientsFilter, RecipesFilter, RecipesOrderingFilter
+from api.matching import recipe_matching_index
 from api.permissions import IsAdminOrAuthorOrReadOnly, IsAdminOrReadOnly
+from api.renderers import SHOPPING_LIST_RENDERERS
 from api.serializers import (CartSerializer, FavoriteSerializer,
                              FollowSerializer, IngredientsSerializer,
-                             RecipeCreateSerializer, RecipesSerializer,
+                             RecipeCreateSerializer, RecipeImageSerializer,
+                             RecipeMatchSerializer, RecipesSerializer,
                              TagsSerializer,)
-from api.utils import add_delete_obj, download_shopping_cart
-from recipes.models import (FavoriteRecipe, Follow, Ingredients, RecipeInCart,
-                            Recipes, Tags,)
+from api.uploads import LimitedUploadHandler
+from api.utils import (add_delete_obj, download_shopping_cart,
+                       get_follows_queryset, get_match_params,
+                       get_recommended_queryset, shopping_cart_summary,)
+from recipes.models import (FavoriteRecipe, Follow, IngredientInRecipe,
+                            Ingredients, RecipeInCart, Recipes, Tags,)
 
 User = get_user_model()
 
 
-class TagsViewSet(viewsets.ReadOnlyModelViewSet):
+class TagsViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     """Base tag's viewset."""
     queryset = Tags.objects.all()
     serializer_class = TagsSerializer
@@ -29,7 +38,8 @@ class TagsViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
 
 
-class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientsViewSet(CachedResponseMixin,
+                         viewsets.ReadOnlyModelViewSet):
     """"Base ingredient's viewset."""
     queryset = Ingredients.objects.all()
     serializer_class = IngredientsSerializer
@@ -44,15 +54,35 @@ class RecipesViewSet(viewsets.ModelViewSet):
     """
     Base recipe's view set. Depending on the requested action, sets the
     Permission class and selects the required serializer. Added actions for
-    favorite, shopping_cart and download_shopping_cart.
+    favorite, shopping_cart, download_shopping_cart, shopping_cart_summary,
+    match, similar, recommended and image.
     """
     queryset = Recipes.objects.all()
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (DjangoFilterBackend, RecipesOrderingFilter,)
     filterset_class = RecipesFilter
+    ordering_fields = ('pub_date', 'favorites_count', 'cart_count',)
+    ordering = ('-pub_date', '-id')
+    cursor_ordering = ('-pub_date', '-id')
+
+    def get_queryset(self):
+        return Recipes.objects.select_related('author').defer(
+            'search_vector').prefetch_related(
+            Prefetch('tags', queryset=Tags.objects.all()),
+            Prefetch('recipe', queryset=IngredientInRecipe.objects.
+                     select_related('ingredient')),
+        )
+
+    def initial(self, request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            request.upload_handlers = [LimitedUploadHandler(request)]
+        super().initial(request, *args, **kwargs)
 
     def get_permissions(self):
-        if self.action in ('update', 'partial_update', 'destroy',):
+        if self.action in ('update', 'partial_update', 'destroy', 'image',):
             permission_classes = (IsAdminOrAuthorOrReadOnly,)
+        elif self.action in ('download_shopping_cart',
+                             'shopping_cart_summary', 'recommended',):
+            permission_classes = (IsAuthenticated,)
         else:
             permission_classes = (IsAuthenticatedOrReadOnly,)
         return [permission() for permission in permission_classes]
@@ -75,10 +105,90 @@ class RecipesViewSet(viewsets.ModelViewSet):
     def shopping_cart(self, request, pk=None):
         return add_delete_obj(request, pk, CartSerializer, RecipeInCart)
 
-    @action(detail=False, methods=['GET'])
+    @action(detail=False, methods=['GET'],
+            renderer_classes=SHOPPING_LIST_RENDERERS)
     def download_shopping_cart(self, request):
         return download_shopping_cart(request)
 
+    @action(detail=False, methods=['GET'])
+    def shopping_cart_summary(self, request):
+        return shopping_cart_summary(request)
+
+    @action(detail=False, methods=['GET'])
+    def match(self, request):
+        """
+        Recipes which can be cooked from the ingredients of the request,
+        ranked by the share of their ingredients the request covers.
+        """
+        ingredient_ids, max_missing = get_match_params(request)
+        matches = recipe_matching_index.match(ingredient_ids, max_missing)
+        # The view is not passed, so a list is always paginated by pages.
+        page = self.paginator.paginate_queryset(matches, request)
+        if page is not None:
+            matches = page
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in matches])
+        result = []
+        for recipe_id, matched, missing in matches:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.matched_ingredients = matched
+                recipe.missing_ingredients = missing
+                result.append(recipe)
+        data = RecipeMatchSerializer(
+            result, many=True, context=self.get_serializer_context()).data
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    @action(detail=True, methods=['GET'])
+    def similar(self, request, pk=None):
+        """The precomputed most similar recipes, the most similar first."""
+        recipes = self.get_queryset().filter(
+            neighbour_of__recipe_id=pk).order_by('neighbour_of__rank')
+        data = RecipesSerializer(
+            recipes, many=True, context=self.get_serializer_context()).data
+        if not data:
+            get_object_or_404(Recipes, pk=pk)
+        return Response(data)
+
+    @action(detail=False, methods=['GET'])
+    def recommended(self, request):
+        """
+        Recipes similar to the favorites and carted recipes of the user,
+        ranked by the sum of their similarities; the most popular recipes
+        for users who have none yet.
+        """
+        queryset = get_recommended_queryset(self.get_queryset(), request.user)
+        # The view is not passed, so the ranking is always paginated by pages.
+        page = self.paginator.paginate_queryset(queryset, request)
+        data = RecipesSerializer(
+            queryset if page is None else page, many=True,
+            context=self.get_serializer_context()).data
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    @action(detail=True, methods=['PUT'],
+            parser_classes=(MultiPartParser, FileUploadParser,))
+    def image(self, request, pk=None):
+        """
+        Replaces the image of the recipe with a file sent as multipart form
+        data (the image field) or as the raw request body with the file name
+        in the Content-Disposition header.
+        """
+        recipe = self.get_object()
+        data = request.data
+        if 'file' in data and 'image' not in data:
+            data = {'image': data['file']}
+        serializer = RecipeImageSerializer(recipe, data=data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        # Django closes only the files of form requests.
+        serializer.validated_data['image'].close()
+        return Response(RecipesSerializer(
+            recipe, context=self.get_serializer_context()).data)
+
 
 class FollowViewSet(viewsets.ModelViewSet):
     """
@@ -87,9 +197,10 @@ class FollowViewSet(viewsets.ModelViewSet):
     """
     serializer_class = FollowSerializer
     permission_classes = (IsAuthenticated,)
+    cursor_ordering = ('id',)
 
     def get_queryset(self):
-        return Follow.objects.filter(follower=self.request.user)
+        return get_follows_queryset(self.request)
 
     def get_serializer_context(self):
         context = super(FollowViewSet, self).get_serializer_context()
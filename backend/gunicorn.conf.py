@@ -0,0 +1,28 @@
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', default='0.0.0.0:8000')
+# Threaded workers serve GUNICORN_THREADS requests per process at a time.
+# Their throughput against sync workers has not been measured; compare them
+# on the deployed containers with the load_test command. Slow clients are
+# buffered by nginx.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', default='gthread')
+# Cached responses, authentication tokens and memberships are invalidated
+# through versions kept in the cache, so several worker processes need a
+# shared cache. A local memory cache is private to a process, so only one
+# process is started by default when the cache is not shared.
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+cache_backend = os.getenv('CACHE_BACKEND', default=LOCAL_CACHE_BACKENDS[0])
+workers = int(os.getenv(
+    'GUNICORN_WORKERS',
+    default=(1 if cache_backend in LOCAL_CACHE_BACKENDS
+             else multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.getenv('GUNICORN_THREADS', default=4))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', default=30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', default=5))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', default=1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER',
+                                    default=100))
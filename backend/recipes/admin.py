@@ -3,8 +3,10 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin
 
 from recipes.admin_tweaks import IngredientsInline
-from recipes.models import (FavoriteRecipe, Follow, IngredientInRecipe,
-                            Ingredients, RecipeInCart, Recipes, Tags,)
+from recipes.models import (FavoriteRecipe, Follow, ImageJob,
+                            IngredientInRecipe, Ingredients, RecipeInCart,
+                            Recipes, Tags,)
+from recipes.search import update_search_index
 
 LINES_PER_PAGE = 20
 TEXT_LINE_LIMIT = 100
@@ -41,19 +43,24 @@ class IngredientInRecipeAdmin(admin.ModelAdmin):
 @admin.register(Recipes)
 class RecipesAdmin(admin.ModelAdmin):
     list_display = ('name', 'author', 'recipe_description', 'cooking_time',
-                    'pub_date', 'get_number_in_favorites',)
+                    'pub_date', 'get_number_in_favorites', 'cart_count',)
     list_filter = ('name', 'author', 'tags',)
     list_per_page = LINES_PER_PAGE
     search_fields = ('name',)
     inlines = (IngredientsInline,)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        update_search_index([form.instance.pk])
+
     @staticmethod
     def recipe_description(obj):
         return obj.text[:TEXT_LINE_LIMIT] + '...'
 
-    @admin.display(description='number of recipe in favorites')
+    @admin.display(description='number of recipe in favorites',
+                   ordering='favorites_count')
     def get_number_in_favorites(self, obj):
-        return obj.fav_recipe.filter(recipe=obj).count()
+        return obj.favorites_count
 
 
 @admin.register(Follow)
@@ -73,3 +80,11 @@ class FavoriteRecipeAdmin(admin.ModelAdmin):
 class RecipeInCartAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe',)
     list_per_page = LINES_PER_PAGE
+
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('image', 'recipe', 'status', 'created', 'updated',)
+    list_filter = ('status',)
+    list_per_page = LINES_PER_PAGE
+    readonly_fields = ('error',)
@@ -0,0 +1,74 @@
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+IMAGE_MAX_SIZE = 1920
+RENDITIONS = {
+    'small': 320,
+    'medium': 640,
+}
+RENDITION_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+REENCODED_FORMATS = ('JPEG', 'PNG', 'WEBP')
+QUALITY = 82
+
+
+def get_rendition_name(name, rendition, extension):
+    root, _ = os.path.splitext(name)
+    return '{}_{}.{}'.format(root, rendition, extension)
+
+
+def get_rendition_names(name):
+    """Returns storage names of all renditions of the image."""
+    return {
+        rendition: {extension: get_rendition_name(name, rendition, extension)
+                    for extension in RENDITION_FORMATS}
+        for rendition in RENDITIONS
+    }
+
+
+def encode(image, image_format):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, '#FFFFFF')
+        image = image.convert('RGBA')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, quality=QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def replace(storage, name, content):
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, ContentFile(content))
+
+
+def process_image(name, storage=default_storage):
+    """
+    Rewrites the original image without metadata and with dimensions capped
+    by IMAGE_MAX_SIZE, then writes the resized webp and jpeg renditions
+    beside it.
+    """
+    with storage.open(name, 'rb') as file:
+        image = Image.open(file)
+        image_format = image.format
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+
+    if image_format in REENCODED_FORMATS:
+        image.thumbnail((IMAGE_MAX_SIZE, IMAGE_MAX_SIZE))
+        replace(storage, name, encode(image, image_format))
+    for rendition, size in RENDITIONS.items():
+        resized = image.copy()
+        resized.thumbnail((size, size))
+        for extension, rendition_format in RENDITION_FORMATS.items():
+            replace(storage, get_rendition_name(name, rendition, extension),
+                    encode(resized, rendition_format))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.recommendations import (MIN_COMMON_USERS, NEIGHBOURS,
+                                     compute_neighbours, load_interactions,
+                                     store_neighbours,)
+
+
+class Command(BaseCommand):
+    help = ('Computes the similar recipes from the co-occurrence of recipes '
+            'in favorites and shopping carts and stores the top neighbours '
+            'of every recipe. Only the recipes whose neighbours have changed '
+            'are rewritten, so the command can be run periodically.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--neighbours', type=int, default=NEIGHBOURS)
+        parser.add_argument('--min-common-users', type=int,
+                            default=MIN_COMMON_USERS)
+        parser.add_argument('--full', action='store_true',
+                            help='Rewrite the neighbours of all recipes.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        matrix, recipe_ids = load_interactions()
+        neighbours = compute_neighbours(matrix, recipe_ids,
+                                        options['neighbours'],
+                                        options['min_common_users'])
+        changed = store_neighbours(neighbours, options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            '{} users, {} recipes with neighbours, {} recipes updated in '
+            '{:.2f}s.'.format(matrix.shape[0], len(neighbours), changed,
+                              time.perf_counter() - started)))
@@ -0,0 +1,164 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.models import Ingredients
+from recipes.signals import ingredients_loaded
+
+CHUNK_SIZE = 5000
+READ_SIZE = 64 * 1024
+NAME_LENGTH = Ingredients._meta.get_field('name').max_length
+UNIT_LENGTH = Ingredients._meta.get_field('measurement_unit').max_length
+
+
+def read_csv(file):
+    """Yields (name, measurement_unit) pairs of a csv file without header."""
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield ','.join(row[:-1]), row[-1]
+
+
+def read_json(file):
+    """
+    Yields (name, measurement_unit) pairs of a json array of objects,
+    decoding it object by object so the file is never loaded as a whole.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+    while True:
+        buffer = buffer[position:].lstrip()
+        position = 0
+        if not started and buffer:
+            if buffer[0] != '[':
+                raise CommandError('A json file must contain an array.')
+            buffer = buffer[1:].lstrip()
+            started = True
+        if buffer.startswith(','):
+            buffer = buffer[1:].lstrip()
+        if started and buffer.startswith(']'):
+            return
+        try:
+            obj, position = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError('The json file is malformed.')
+            chunk = file.read(READ_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield obj['name'], obj['measurement_unit']
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+def clean_rows(rows):
+    """Strips values and skips rows which do not fit the model fields."""
+    for name, measurement_unit in rows:
+        name, measurement_unit = name.strip(), measurement_unit.strip()
+        if (name and measurement_unit and len(name) <= NAME_LENGTH
+                and len(measurement_unit) <= UNIT_LENGTH):
+            yield name, measurement_unit
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    chunk = list(islice(rows, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(rows, size))
+
+
+def copy_chunk(cursor, chunk):
+    """
+    Loads a chunk with COPY into a temporary table and moves it into the
+    ingredients table skipping rows which already exist.
+    """
+    table = Ingredients._meta.db_table
+    data = io.StringIO()
+    csv.writer(data).writerows(chunk)
+    data.seek(0)
+    cursor.execute('TRUNCATE ingredients_import')
+    cursor.copy_expert(
+        'COPY ingredients_import (name, measurement_unit) '
+        'FROM STDIN WITH (FORMAT csv)', data)
+    cursor.execute(
+        'INSERT INTO {} (name, measurement_unit) '
+        'SELECT DISTINCT name, measurement_unit FROM ingredients_import '
+        'ON CONFLICT DO NOTHING'.format(table))
+
+
+def bulk_create_chunk(chunk):
+    Ingredients.objects.bulk_create(
+        (Ingredients(name=name, measurement_unit=measurement_unit)
+         for name, measurement_unit in chunk),
+        batch_size=len(chunk),
+        ignore_conflicts=True,
+    )
+
+
+class Command(BaseCommand):
+    help = ('Loads ingredients from csv (name,measurement_unit without '
+            'header) or json (an array of objects with name and '
+            'measurement_unit) files. Ingredients which already exist are '
+            'skipped, so the command can be run repeatedly.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', type=Path)
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--no-copy', action='store_true',
+                            help='Do not use COPY on PostgreSQL.')
+
+    def handle(self, *args, **options):
+        use_copy = (connection.vendor == 'postgresql'
+                    and not options['no_copy'])
+        for path in options['paths']:
+            reader = READERS.get(path.suffix.lower())
+            if reader is None:
+                raise CommandError(
+                    'Unsupported file type: {}'.format(path.name))
+            if not path.is_file():
+                raise CommandError('No such file: {}'.format(path))
+            self.load(path, reader, options['chunk_size'], use_copy)
+
+    def load(self, path, reader, chunk_size, use_copy):
+        count_before = Ingredients.objects.count()
+        rows_count = 0
+        started = time.perf_counter()
+        with open(path, encoding='utf-8', newline='') as file, \
+                transaction.atomic():
+            chunks = chunked(clean_rows(reader(file)), chunk_size)
+            if use_copy:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'CREATE TEMPORARY TABLE ingredients_import '
+                        '(name varchar, measurement_unit varchar) '
+                        'ON COMMIT DROP')
+                    for chunk in chunks:
+                        copy_chunk(cursor, chunk)
+                        rows_count += len(chunk)
+            else:
+                for chunk in chunks:
+                    bulk_create_chunk(chunk)
+                    rows_count += len(chunk)
+        elapsed = time.perf_counter() - started
+        created = Ingredients.objects.count() - count_before
+        if created:
+            ingredients_loaded.send(sender=Ingredients)
+        self.stdout.write(self.style.SUCCESS(
+            '{}: {} rows read, {} ingredients created in {:.2f}s '
+            '({:.0f} rows/sec).'.format(
+                path.name, rows_count, created, elapsed,
+                rows_count / elapsed if elapsed else rows_count)))
@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from recipes.images import process_image
+from recipes.models import ImageJob, Recipes
+
+BATCH_SIZE = 20
+POLL_INTERVAL = 2.0
+STALE_AFTER = timedelta(minutes=10)
+
+
+class Command(BaseCommand):
+    help = ('Processes the queued recipe images (metadata stripping, '
+            'resizing and renditions) in a pool of worker processes. The '
+            'queue is the ImageJob table, so no message broker is needed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--poll-interval', type=float,
+                            default=POLL_INTERVAL)
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when the queue is empty.')
+
+    def handle(self, *args, **options):
+        self.requeue_stale()
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=options['workers'],
+                                 mp_context=context,
+                                 initializer=django.setup) as executor:
+            while True:
+                jobs = self.claim(options['batch_size'])
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                futures = {executor.submit(process_image, job.image): job
+                           for job in jobs}
+                for future in as_completed(futures):
+                    self.finish(futures[future], future.exception())
+
+    def requeue_stale(self):
+        """Returns jobs of a worker which stopped while processing them."""
+        ImageJob.objects.filter(
+            status=ImageJob.PROCESSING,
+            updated__lt=timezone.now() - STALE_AFTER,
+        ).update(status=ImageJob.PENDING)
+
+    def claim(self, batch_size):
+        skip_locked = connection.features.has_select_for_update_skip_locked
+        with transaction.atomic():
+            jobs = list(ImageJob.objects.select_for_update(
+                skip_locked=skip_locked).filter(
+                status=ImageJob.PENDING)[:batch_size])
+            ImageJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                status=ImageJob.PROCESSING, updated=timezone.now())
+        return jobs
+
+    def finish(self, job, error):
+        if error is None:
+            job.status, image_status = ImageJob.DONE, Recipes.IMAGE_READY
+        else:
+            job.status, image_status = ImageJob.FAILED, Recipes.IMAGE_FAILED
+            job.error = repr(error)
+            self.stderr.write('{}: {!r}'.format(job.image, error))
+        job.save(update_fields=('status', 'error', 'updated'))
+        Recipes.objects.filter(pk=job.recipe_id, image=job.image).update(
+            image_status=image_status)
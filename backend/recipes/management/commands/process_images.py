@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import get_rendition_names, process_image
+from recipes.models import Recipes
+
+
+class Command(BaseCommand):
+    help = ('Strips metadata, caps dimensions and writes the resized '
+            'renditions of the recipe images uploaded before the image '
+            'pipeline existed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Process images which already have '
+                                 'renditions too.')
+
+    @staticmethod
+    def has_renditions(image):
+        return all(image.storage.exists(name)
+                   for names in get_rendition_names(image.name).values()
+                   for name in names.values())
+
+    def handle(self, *args, **options):
+        processed = failed = 0
+        recipes = Recipes.objects.exclude(image='').only('pk', 'image')
+        for recipe in recipes.iterator():
+            if not options['all'] and self.has_renditions(recipe.image):
+                continue
+            try:
+                process_image(recipe.image.name, recipe.image.storage)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write('Recipe {}: {}'.format(recipe.pk, error))
+                continue
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            '{} images processed, {} failed.'.format(processed, failed)))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipes
+from recipes.search import create_search_vector_index, update_search_index
+
+CHUNK_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the search index of all recipes: the search vectors '
+            'on PostgreSQL, the inverted index of terms on other databases.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        create_search_vector_index()
+        recipe_ids = list(Recipes.objects.order_by('pk').values_list(
+            'pk', flat=True))
+        chunk_size = options['chunk_size']
+        for start in range(0, len(recipe_ids), chunk_size):
+            update_search_index(recipe_ids[start:start + chunk_size])
+        self.stdout.write(self.style.SUCCESS(
+            'Search index of {} recipes rebuilt.'.format(len(recipe_ids))))
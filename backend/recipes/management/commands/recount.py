@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import FavoriteRecipe, RecipeInCart, Recipes
+
+
+def count_subquery(model):
+    return Coalesce(Subquery(
+        model.objects.filter(recipe=OuterRef('pk')).order_by().values(
+            'recipe').annotate(count=Count('pk')).values('count')), 0)
+
+
+class Command(BaseCommand):
+    help = ('Recounts the favorites_count and cart_count counters of the '
+            'recipes and repairs the ones which have drifted.')
+
+    def handle(self, *args, **options):
+        drifted = Recipes.objects.annotate(
+            actual_favorites=count_subquery(FavoriteRecipe),
+            actual_cart=count_subquery(RecipeInCart),
+        ).exclude(
+            Q(favorites_count=F('actual_favorites'))
+            & Q(cart_count=F('actual_cart'))
+        ).values_list('pk', flat=True)
+        drifted = list(drifted)
+        Recipes.objects.filter(pk__in=drifted).update(
+            favorites_count=count_subquery(FavoriteRecipe),
+            cart_count=count_subquery(RecipeInCart),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            'Counters of {} recipes repaired.'.format(len(drifted))))
@@ -0,0 +1,50 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from recipes.shopping_list import find_drifted_users, rebuild_shopping_lists
+
+USERS_PER_CHUNK = 500
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Compares the materialized shopping lists with the live '
+            'aggregate of the shopping carts and reports (or with --rebuild '
+            'repairs) the users whose lists have drifted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Rebuild the lists which have drifted.')
+        parser.add_argument('--all', action='store_true',
+                            help='Rebuild the lists of all users.')
+
+    def handle(self, *args, **options):
+        user_ids = list(User.objects.filter(
+            Q(buyer__isnull=False) | Q(shopping_list__isnull=False),
+        ).order_by('pk').values_list('pk', flat=True).distinct())
+        drifted = []
+        for start in range(0, len(user_ids), USERS_PER_CHUNK):
+            chunk = user_ids[start:start + USERS_PER_CHUNK]
+            if options['all']:
+                rebuild_shopping_lists(chunk)
+                continue
+            chunk_drifted = find_drifted_users(chunk)
+            if chunk_drifted and options['rebuild']:
+                rebuild_shopping_lists(chunk_drifted)
+            drifted.extend(chunk_drifted)
+        if options['all']:
+            self.stdout.write(self.style.SUCCESS(
+                'Shopping lists of {} users rebuilt.'.format(len(user_ids))))
+        elif options['rebuild']:
+            self.stdout.write(self.style.SUCCESS(
+                'Shopping lists of {} users repaired.'.format(len(drifted))))
+        elif drifted:
+            raise CommandError(
+                'Shopping lists of {} users have drifted: {}.'.format(
+                    len(drifted), ', '.join(map(str, drifted))))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                'Shopping lists of {} users are up to date.'.format(
+                    len(user_ids))))
@@ -1,8 +1,12 @@
 from colorfield.fields import ColorField
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
 
+from recipes.images import process_image
+
 LIMIT_MIN_INT = [MinValueValidator(1, message='Enter a positive value '
                                               'greater or equal to one')]
 
@@ -74,6 +78,15 @@ class IngredientInRecipe(models.Model):
 
 class Recipes(models.Model):
     """A model to represent recipes."""
+    IMAGE_PENDING = 'pending'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUSES = (
+        (IMAGE_PENDING, 'pending'),
+        (IMAGE_READY, 'ready'),
+        (IMAGE_FAILED, 'failed'),
+    )
+
     name = models.CharField('recipe name', max_length=100)
     author = models.ForeignKey(
         User,
@@ -96,15 +109,100 @@ class Recipes(models.Model):
                                     auto_now_add=True,)
     text = models.TextField('recipe description')
     image = models.ImageField('dish image', upload_to=user_image_upload_path)
+    image_status = models.CharField(
+        'image processing status', max_length=10, choices=IMAGE_STATUSES,
+        default=IMAGE_READY, editable=False)
     cooking_time = models.PositiveSmallIntegerField(validators=LIMIT_MIN_INT)
+    favorites_count = models.PositiveIntegerField(
+        'number of recipe in favorites', default=0, editable=False)
+    cart_count = models.PositiveIntegerField(
+        'number of recipe in shopping carts', default=0, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
         verbose_name_plural = 'recipes'
+        indexes = [
+            models.Index(
+                name='recipes_pub_date_id_idx',
+                fields=['-pub_date', '-id'],
+            )
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """
+        A newly uploaded image is processed by the image jobs worker, or
+        right away when IMAGE_PROCESSING_ASYNC is off.
+        """
+        image_uploaded = bool(self.image) and not self.image._committed
+        if image_uploaded and settings.IMAGE_PROCESSING_ASYNC:
+            self.image_status = self.IMAGE_PENDING
+        super().save(*args, **kwargs)
+        if not image_uploaded:
+            return
+        if settings.IMAGE_PROCESSING_ASYNC:
+            ImageJob.objects.create(recipe=self, image=self.image.name)
+            return
+        process_image(self.image.name, self.image.storage)
+        if self.image_status != self.IMAGE_READY:
+            self.image_status = self.IMAGE_READY
+            super().save(update_fields=('image_status',))
+
+
+class ImageJob(models.Model):
+    """A model to represent queued recipe image processing jobs."""
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'pending'),
+        (PROCESSING, 'processing'),
+        (DONE, 'done'),
+        (FAILED, 'failed'),
+    )
+    recipe = models.ForeignKey(Recipes, on_delete=models.CASCADE,
+                               related_name='image_jobs')
+    image = models.CharField('image name', max_length=100)
+    status = models.CharField(max_length=10, choices=STATUSES,
+                              default=PENDING)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(name='image_jobs_status_idx',
+                         fields=['status', 'id'])
+        ]
+
+    def __str__(self):
+        return self.image
+
+
+class SearchTerm(models.Model):
+    """
+    A model to represent the inverted search index of recipes, used instead
+    of the search vectors on databases other than PostgreSQL.
+    """
+    recipe = models.ForeignKey(Recipes, on_delete=models.CASCADE,
+                               related_name='search_terms')
+    term = models.CharField('term', max_length=50)
+    weight = models.FloatField('weight')
+
+    class Meta:
+        indexes = [
+            models.Index(name='search_terms_term_idx',
+                         fields=['term', 'recipe'])
+        ]
+
+    def __str__(self):
+        return self.term
+
 
 class Follow(models.Model):
     """A model to represent follows."""
@@ -152,3 +250,53 @@ class RecipeInCart(models.Model):
 
     def __str__(self):
         return self.user.username
+
+
+class ShoppingListItem(models.Model):
+    """
+    A model to represent the aggregated shopping list of a user: the total
+    amount of an ingredient in the recipes of the shopping cart and the
+    number of recipe rows it comes from.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='shopping_list')
+    ingredient = models.ForeignKey(Ingredients, on_delete=models.CASCADE,
+                                   related_name='shopping_list_items')
+    amount = models.PositiveIntegerField('amount of ingredient', default=0)
+    recipes = models.PositiveIntegerField('number of recipes', default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='unique_shopping_list_item')
+        ]
+        indexes = [
+            models.Index(name='shopping_list_amount_idx',
+                         fields=['user', '-amount'])
+        ]
+
+    def __str__(self):
+        return self.user.username
+
+
+class RecipeNeighbour(models.Model):
+    """
+    A model to represent the most similar recipes of a recipe, computed in
+    batch from the favorites and shopping carts of the users.
+    """
+    recipe = models.ForeignKey(Recipes, on_delete=models.CASCADE,
+                               related_name='neighbours')
+    neighbour = models.ForeignKey(Recipes, on_delete=models.CASCADE,
+                                  related_name='neighbour_of')
+    rank = models.PositiveSmallIntegerField('rank')
+    score = models.FloatField('similarity')
+
+    class Meta:
+        ordering = ['recipe', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'rank'],
+                                    name='unique_recipe_neighbour_rank')
+        ]
+
+    def __str__(self):
+        return '{} -> {}'.format(self.recipe_id, self.neighbour_id)
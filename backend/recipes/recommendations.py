@@ -0,0 +1,107 @@
+import numpy as np
+from django.db import transaction
+from scipy import sparse
+
+from recipes.models import FavoriteRecipe, RecipeInCart, RecipeNeighbour
+
+NEIGHBOURS = 20
+MIN_COMMON_USERS = 2
+SCORE_PRECISION = 4
+CHUNK_SIZE = 10000
+BATCH_SIZE = 1000
+
+
+def load_interactions():
+    """
+    Returns the user by recipe matrix of the favorites and shopping carts
+    (1 when the user has the recipe in either) and the recipe id of every
+    column.
+    """
+    pairs = [
+        np.fromiter(
+            (value for row in model.objects.values_list(
+                'user_id', 'recipe_id').iterator(chunk_size=CHUNK_SIZE)
+             for value in row), dtype=np.int64).reshape(-1, 2)
+        for model in (FavoriteRecipe, RecipeInCart)
+    ]
+    pairs = np.concatenate(pairs)
+    users, user_index = np.unique(pairs[:, 0], return_inverse=True)
+    recipe_ids, recipe_index = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (user_index, recipe_index)),
+        shape=(len(users), len(recipe_ids)))
+    matrix.data[:] = 1
+    return matrix, recipe_ids
+
+
+def compute_neighbours(matrix, recipe_ids, neighbours=NEIGHBOURS,
+                       min_common_users=MIN_COMMON_USERS):
+    """
+    Returns the top neighbours of every recipe as {recipe id: [(neighbour
+    id, score), ...]}. Recipes are similar by the cosine of their columns:
+    the number of users who have both, normalized by the popularity of
+    each, so popular recipes do not become neighbours of everything.
+    """
+    co_occurrence = (matrix.T @ matrix).tocsr()
+    popularity = co_occurrence.diagonal()
+    co_occurrence.setdiag(0)
+    co_occurrence.data[co_occurrence.data < min_common_users] = 0
+    co_occurrence.eliminate_zeros()
+    norm = sparse.diags(1 / np.sqrt(np.maximum(popularity, 1)))
+    similarity = (norm @ co_occurrence @ norm).tocsr()
+
+    result = {}
+    for row in range(similarity.shape[0]):
+        start, end = similarity.indptr[row], similarity.indptr[row + 1]
+        if start == end:
+            continue
+        scores = similarity.data[start:end]
+        columns = similarity.indices[start:end]
+        if len(scores) > neighbours:
+            top = np.argpartition(-scores, neighbours)[:neighbours]
+            scores, columns = scores[top], columns[top]
+        order = np.lexsort((recipe_ids[columns], -scores))
+        result[int(recipe_ids[row])] = [
+            (int(recipe_ids[columns[index]]),
+             round(float(scores[index]), SCORE_PRECISION))
+            for index in order]
+    return result
+
+
+def load_stored_neighbours():
+    stored = {}
+    for recipe_id, neighbour_id, score in RecipeNeighbour.objects.order_by(
+            'recipe_id', 'rank').values_list(
+            'recipe_id', 'neighbour_id', 'score').iterator(
+            chunk_size=CHUNK_SIZE):
+        stored.setdefault(recipe_id, []).append((neighbour_id, score))
+    return stored
+
+
+def store_neighbours(neighbours, full=False):
+    """
+    Writes the neighbours of the recipes whose neighbours have changed
+    since the previous build (of all recipes with full) and deletes the
+    ones of recipes which have no neighbours any more. Returns the number
+    of changed recipes.
+    """
+    stored = {} if full else load_stored_neighbours()
+    changed = [recipe_id for recipe_id, recipe_neighbours in neighbours.items()
+               if stored.get(recipe_id) != recipe_neighbours]
+    removed = [recipe_id for recipe_id in stored
+               if recipe_id not in neighbours]
+    outdated = changed + removed
+    with transaction.atomic():
+        if full:
+            RecipeNeighbour.objects.all().delete()
+        for start in range(0, len(outdated), BATCH_SIZE):
+            RecipeNeighbour.objects.filter(
+                recipe_id__in=outdated[start:start + BATCH_SIZE]).delete()
+        RecipeNeighbour.objects.bulk_create(
+            (RecipeNeighbour(recipe_id=recipe_id, neighbour_id=neighbour_id,
+                             rank=rank, score=score)
+             for recipe_id in changed
+             for rank, (neighbour_id, score) in enumerate(
+                neighbours[recipe_id])),
+            batch_size=BATCH_SIZE)
+    return len(outdated)
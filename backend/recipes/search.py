@@ -0,0 +1,151 @@
+import re
+import threading
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector,)
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import (Case, F, IntegerField, Max, OuterRef, Q,
+                              Subquery, Sum, When,)
+
+from recipes.models import IngredientInRecipe, Recipes, SearchTerm
+
+# Weights of the searched fields, the same as the default weights of
+# ts_rank, so both backends rank the recipes alike.
+NAME_WEIGHT = ('A', 1.0)
+INGREDIENTS_WEIGHT = ('B', 0.4)
+TEXT_WEIGHT = ('C', 0.2)
+TOKEN_RE = re.compile(r'\w{2,}')
+TERM_LENGTH = SearchTerm._meta.get_field('term').max_length
+SEARCH_INDEX_NAME = 'recipes_search_vector_idx'
+BATCH_SIZE = 1000
+
+
+def tokenize(text):
+    """Returns lower-cased words of the text, at least two letters long."""
+    return [token[:TERM_LENGTH] for token in TOKEN_RE.findall(text.lower())]
+
+
+def use_search_vector():
+    return connection.vendor == 'postgresql'
+
+
+def create_search_vector_index(using=DEFAULT_DB_ALIAS):
+    """
+    Creates the GIN index of the search vectors on PostgreSQL. The model
+    does not declare it, so the schema stays portable to other databases.
+    """
+    db_connection = connections[using]
+    if db_connection.vendor != 'postgresql':
+        return
+    quote_name = db_connection.ops.quote_name
+    with db_connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS {} ON {} USING gin ({})'.format(
+                quote_name(SEARCH_INDEX_NAME),
+                quote_name(Recipes._meta.db_table),
+                quote_name(Recipes._meta.get_field('search_vector').column)))
+
+
+def update_search_vectors(recipe_ids):
+    config = settings.SEARCH_CONFIG
+    ingredient_names = IngredientInRecipe.objects.filter(
+        recipe=OuterRef('pk')).order_by().values('recipe').annotate(
+        names=StringAgg('ingredient__name', ' ')).values('names')
+    Recipes.objects.filter(pk__in=recipe_ids).update(search_vector=(
+        SearchVector('name', weight=NAME_WEIGHT[0], config=config)
+        + SearchVector(Subquery(ingredient_names),
+                       weight=INGREDIENTS_WEIGHT[0], config=config)
+        + SearchVector('text', weight=TEXT_WEIGHT[0], config=config)))
+
+
+def update_search_terms(recipe_ids):
+    ingredient_names = defaultdict(list)
+    for recipe_id, name in IngredientInRecipe.objects.filter(
+            recipe_id__in=recipe_ids).values_list('recipe_id',
+                                                  'ingredient__name'):
+        ingredient_names[recipe_id].append(name)
+    terms = []
+    for pk, name, text in Recipes.objects.filter(
+            pk__in=recipe_ids).values_list('pk', 'name', 'text'):
+        weights = defaultdict(float)
+        for field_text, (_, weight) in (
+                (name, NAME_WEIGHT),
+                (' '.join(ingredient_names[pk]), INGREDIENTS_WEIGHT),
+                (text, TEXT_WEIGHT)):
+            for term in set(tokenize(field_text)):
+                weights[term] += weight
+        terms.extend(SearchTerm(recipe_id=pk, term=term, weight=weight)
+                     for term, weight in weights.items())
+    SearchTerm.objects.filter(recipe_id__in=recipe_ids).delete()
+    SearchTerm.objects.bulk_create(terms, batch_size=BATCH_SIZE)
+
+
+def update_search_index(recipe_ids):
+    """
+    Rebuilds the search data of the recipes from their name, ingredients
+    and text: the search vectors on PostgreSQL, the inverted index of
+    terms on other databases.
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    if use_search_vector():
+        update_search_vectors(recipe_ids)
+    else:
+        update_search_terms(recipe_ids)
+
+
+_local = threading.local()
+
+
+def _update_pending():
+    recipe_ids = _local.__dict__.pop('pending', None)
+    if recipe_ids:
+        update_search_index(recipe_ids)
+
+
+def schedule_search_index_update(recipe_ids):
+    """
+    Rebuilds the search data of the recipes once the current transaction
+    is committed, once for all the rows changed in the transaction.
+    """
+    _local.__dict__.setdefault('pending', set()).update(recipe_ids)
+    transaction.on_commit(_update_pending)
+
+
+def term_prefix(token):
+    return Q(term__gte=token, term__lt=token + '\uffff')
+
+
+def search_recipes(queryset, value):
+    """
+    Filters the recipes which match every word of the value (as a prefix)
+    and annotates them with the search_rank.
+    """
+    tokens = tokenize(value)
+    if not tokens:
+        return queryset.none()
+    if use_search_vector():
+        query = SearchQuery(' & '.join(token + ':*' for token in tokens),
+                            config=settings.SEARCH_CONFIG, search_type='raw')
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query))
+    matched = {
+        'token_{}'.format(index): Max(Case(
+            When(term_prefix(token), then=1), default=0,
+            output_field=IntegerField()))
+        for index, token in enumerate(tokens)
+    }
+    terms = SearchTerm.objects.filter(
+        reduce(or_, (term_prefix(token) for token in tokens)),
+    ).order_by().values('recipe').annotate(
+        rank=Sum('weight'), **matched,
+    ).filter(**{name: 1 for name in matched})
+    return queryset.filter(pk__in=terms.values('recipe')).annotate(
+        search_rank=Subquery(
+            terms.filter(recipe=OuterRef('pk')).values('rank')))
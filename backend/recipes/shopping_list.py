@@ -0,0 +1,169 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+
+from recipes.models import (IngredientInRecipe, RecipeInCart, ShoppingListItem,
+                            User,)
+from recipes.signals import shopping_lists_changed
+
+BATCH_SIZE = 1000
+
+
+def lock_shopping_lists(user_ids):
+    """
+    Locks the rows of the users until the end of the transaction, so the
+    changes of a shopping list are serialized, including the creation of
+    items which do not exist yet and so cannot be locked themselves. The
+    lock does not conflict with the key share locks of the inserted rows
+    which reference the user, e.g. the shopping cart entry being added.
+    """
+    list(User.objects.select_for_update(no_key=True).filter(
+        pk__in=user_ids).order_by('pk').values_list('pk', flat=True))
+
+
+def apply_deltas(deltas):
+    """
+    Adds the deltas {(user id, ingredient id): (amount, recipes)} to the
+    shopping list items, creating the missing items and deleting the ones
+    which no recipe contributes to any more. Within a transaction, e.g. of
+    the shopping cart entry which changed, a failure rolls back the whole
+    transaction, so the list does not drift from the cart.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    user_ids = {user_id for user_id, _ in deltas}
+    with transaction.atomic(savepoint=False):
+        lock_shopping_lists(user_ids)
+        items = {
+            (item.user_id, item.ingredient_id): item
+            for item in ShoppingListItem.objects.filter(
+                user_id__in=user_ids,
+                ingredient_id__in={ingredient_id for _, ingredient_id
+                                   in deltas})
+        }
+        to_create, to_update, to_delete = [], [], []
+        for (user_id, ingredient_id), (amount, recipes) in deltas.items():
+            item = items.get((user_id, ingredient_id))
+            if item is None:
+                if recipes > 0:
+                    to_create.append(ShoppingListItem(
+                        user_id=user_id, ingredient_id=ingredient_id,
+                        amount=max(amount, 0), recipes=recipes))
+                continue
+            item.amount = max(item.amount + amount, 0)
+            item.recipes += recipes
+            if item.recipes > 0:
+                to_update.append(item)
+            else:
+                to_delete.append(item.pk)
+        if to_delete:
+            ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            ShoppingListItem.objects.bulk_update(
+                to_update, ('amount', 'recipes'), batch_size=BATCH_SIZE)
+        if to_create:
+            ShoppingListItem.objects.bulk_create(to_create,
+                                                 batch_size=BATCH_SIZE)
+        shopping_lists_changed.send(sender=ShoppingListItem,
+                                    user_ids=user_ids)
+
+
+def update_cart_recipe(user_id, recipe_id, sign):
+    """Adds (sign 1) or removes (sign -1) the recipe ingredients."""
+    deltas = defaultdict(lambda: [0, 0])
+    for ingredient_id, amount in IngredientInRecipe.objects.filter(
+            recipe_id=recipe_id).values_list('ingredient_id', 'amount'):
+        delta = deltas[user_id, ingredient_id]
+        delta[0] += sign * (amount or 0)
+        delta[1] += sign
+    apply_deltas(deltas)
+
+
+def update_ingredient_row(old, new):
+    """
+    Moves the shopping lists of the users who have the recipe in the cart
+    from the old (recipe id, ingredient id, amount) of an ingredient row to
+    the new one, None standing for a row which did not or does not exist.
+    """
+    rows = [(row, sign) for row, sign in ((old, -1), (new, 1))
+            if row is not None]
+    if old == new or not rows:
+        return
+    carts = defaultdict(list)
+    for user_id, recipe_id in RecipeInCart.objects.filter(
+            recipe_id__in={row[0] for row, _ in rows}).values_list(
+            'user_id', 'recipe_id'):
+        carts[recipe_id].append(user_id)
+    deltas = defaultdict(lambda: [0, 0])
+    for (recipe_id, ingredient_id, amount), sign in rows:
+        for user_id in carts[recipe_id]:
+            delta = deltas[user_id, ingredient_id]
+            delta[0] += sign * (amount or 0)
+            delta[1] += sign
+    apply_deltas(deltas)
+
+
+def update_recipe_ingredients(recipe_id, changes):
+    """
+    Applies the changes {ingredient id: (amount, rows)} of the recipe
+    ingredients to the shopping lists of the users who have the recipe in
+    the shopping cart.
+    """
+    changes = {key: change for key, change in changes.items() if any(change)}
+    if not changes:
+        return
+    users = RecipeInCart.objects.filter(recipe_id=recipe_id).values_list(
+        'user_id', flat=True)
+    apply_deltas({(user_id, ingredient_id): change
+                  for user_id in users
+                  for ingredient_id, change in changes.items()})
+
+
+def get_live_items(user_ids):
+    """
+    Returns the shopping list items of the users aggregated from their
+    shopping carts as {(user id, ingredient id): (amount, recipes)}.
+    """
+    rows = IngredientInRecipe.objects.filter(
+        recipe__recipe_in_cart__user_id__in=user_ids,
+    ).order_by().values_list(
+        'recipe__recipe_in_cart__user_id', 'ingredient_id',
+    ).annotate(amount=Coalesce(Sum('amount'), 0), recipes=Count('id'))
+    return {(user_id, ingredient_id): (amount, recipes)
+            for user_id, ingredient_id, amount, recipes in rows}
+
+
+def get_stored_items(user_ids):
+    return {(user_id, ingredient_id): (amount, recipes)
+            for user_id, ingredient_id, amount, recipes
+            in ShoppingListItem.objects.filter(
+                user_id__in=user_ids).values_list(
+                'user_id', 'ingredient_id', 'amount', 'recipes')}
+
+
+def find_drifted_users(user_ids):
+    """Returns the users whose stored shopping list differs from the live
+    aggregate of their shopping carts."""
+    live, stored = get_live_items(user_ids), get_stored_items(user_ids)
+    return sorted({user_id for user_id, _ in live.keys() ^ stored.keys()}
+                  | {key[0] for key in live.keys() & stored.keys()
+                     if live[key] != stored[key]})
+
+
+def rebuild_shopping_lists(user_ids):
+    """Replaces the shopping lists of the users with the live aggregate."""
+    user_ids = list(user_ids)
+    with transaction.atomic():
+        lock_shopping_lists(user_ids)
+        ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+        ShoppingListItem.objects.bulk_create(
+            (ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                              amount=amount, recipes=recipes)
+             for (user_id, ingredient_id), (amount, recipes)
+             in get_live_items(user_ids).items()),
+            batch_size=BATCH_SIZE)
+        shopping_lists_changed.send(sender=ShoppingListItem,
+                                    user_ids=user_ids)
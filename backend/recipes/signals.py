@@ -0,0 +1,9 @@
+from django.dispatch import Signal
+
+# Sent by the load_ingredients command, which inserts the ingredients in
+# bulk without post_save signals.
+ingredients_loaded = Signal()
+
+# Sent with the ids of the users (user_ids) whose shopping lists were changed
+# by the current transaction.
+shopping_lists_changed = Signal()
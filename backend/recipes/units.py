@@ -0,0 +1,73 @@
+import re
+from collections import defaultdict
+
+from django.db.models import Case, CharField, F, IntegerField, Value, When
+
+GRAM = 'g'
+MILLILITRE = 'ml'
+PIECE = 'pcs.'
+
+# Normalized units of the catalog (see normalize_unit) with their canonical
+# unit and the multiplier of the amount. Units which are not here (to taste,
+# pinch, handful and so on) are left as they are.
+UNIT_CONVERSIONS = {
+    'g': (GRAM, 1),
+    'r': (GRAM, 1),
+    'kg': (GRAM, 1000),
+    'ml': (MILLILITRE, 1),
+    'l': (MILLILITRE, 1000),
+    'tsp': (MILLILITRE, 5),
+    'hl': (MILLILITRE, 5),
+    'hourl': (MILLILITRE, 5),
+    'tbsp': (MILLILITRE, 15),
+    'stl': (MILLILITRE, 15),
+    'stdl': (MILLILITRE, 15),
+    'artl': (MILLILITRE, 15),
+    'glass': (MILLILITRE, 200),
+    'pcs': (PIECE, 1),
+    'piece': (PIECE, 1),
+    'pieces': (PIECE, 1),
+}
+
+
+def normalize_unit(unit):
+    """
+    Lowercases the unit and drops spaces and dots, so the spellings of the
+    catalog match one key: 'St . l.' and 'st. l.' are both 'stl'.
+    """
+    return re.sub(r'[\s.]', '', unit.lower())
+
+
+def group_units(units, index):
+    """
+    Groups the convertible units as spelled in the catalog by their
+    canonical unit (index 0) or multiplier (index 1).
+    """
+    groups = defaultdict(list)
+    for unit in sorted(units):
+        conversion = UNIT_CONVERSIONS.get(normalize_unit(unit))
+        if conversion is not None:
+            groups[conversion[index]].append(unit)
+    return groups.items()
+
+
+def annotate_canonical_units(queryset, unit_field, amount_field, units):
+    """
+    Annotates the queryset with canonical_unit and canonical_amount, the
+    amount converted to the canonical unit of its dimension, so amounts in
+    g and kg or in tsp. and tbsp. can be summed by the database. units are
+    the spellings of the catalog; the conditions compare the column with
+    them as they are, which is cheaper than normalizing every row.
+    """
+    lookup = '{}__in'.format(unit_field)
+    return queryset.annotate(
+        canonical_unit=Case(
+            *(When(**{lookup: spellings, 'then': Value(unit)})
+              for unit, spellings in group_units(units, 0)),
+            default=F(unit_field), output_field=CharField()),
+        canonical_amount=F(amount_field) * Case(
+            *(When(**{lookup: spellings, 'then': Value(multiplier)})
+              for multiplier, spellings in group_units(units, 1)
+              if multiplier != 1),
+            default=Value(1), output_field=IntegerField()),
+    )